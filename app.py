@@ -1,55 +1,118 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from data_handler import DataHandler
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, g, has_request_context,
+                   jsonify, Response, stream_with_context)
+from werkzeug.http import is_resource_modified
+from data_handler import DataHandler, now_timestamp, slot_minutes, slot_timestamp
+from storage import get_codec
+from importer import CATALOG, import_catalog, source_format
+from passwords import PasswordHasher, PasswordHasherBusy
+from search import SUGGESTION_TYPES, Autocompleter, SymptomMatcher
+import click
+import csv
+import hashlib
+import io
+import json
+import os
 import uuid
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'  # Change this in production!
 
-# Initialize data handler
-data_handler = DataHandler()
-
 # Available time slots for booking
 TIME_SLOTS = [
     "09:00 AM", "10:00 AM", "11:00 AM", "12:00 PM",
     "02:00 PM", "03:00 PM", "04:00 PM", "05:00 PM"
 ]
 
+# Appointments per page on the admin dashboard
+ADMIN_PAGE_SIZE = 50
+
+# Columns of the admin CSV export, and rows written per streamed chunk
+EXPORT_FIELDS = [
+    'id', 'date', 'time', 'status', 'payment_status', 'payment_method', 'transaction_id',
+    'user_id', 'user_name', 'user_email', 'doctor_id', 'doctor_name', 'hospital_id',
+    'hospital_name', 'reason', 'booked_at', 'paid_at', 'refunded_at'
+]
+EXPORT_BATCH = 200
+# Leading characters that make a spreadsheet read a CSV cell as a formula
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Rendered public catalog responses kept per catalog version, and how long clients may reuse them
+CATALOG_RESPONSE_CACHE_SIZE = 1024
+CATALOG_MAX_AGE = 60
+
+# Password hashing runs in a bounded process pool, off the request threads
+# (PASSWORD_HASH_WORKERS processes, at most PASSWORD_HASH_QUEUE waiting calls)
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None,
+    max_pending=int(os.environ.get('PASSWORD_HASH_QUEUE', 0)) or None
+)
+
+# Initialize data handler
+# Storage backend for users and appointments: 'json' (default), 'sqlite' or 'journal'
+# (run `python storage.py migrate` once before switching to sqlite).
+# Data files are compact JSON, via orjson when installed; JSON_CODEC=json forces
+# the stdlib encoder and JSON_PRETTY=1 indents the files for reading by hand
+data_handler = DataHandler(backend=os.environ.get('STORAGE_BACKEND', 'json'),
+                           time_slots=TIME_SLOTS,
+                           codec=get_codec(os.environ.get('JSON_CODEC', 'auto'),
+                                           pretty=os.environ.get('JSON_PRETTY') == '1'))
+
+def request_snapshot():
+    """Datasets read so far in this request, shared by every data_handler read"""
+    return g.setdefault('datasets', {}) if has_request_context() else None
+
+data_handler.snapshot_store = request_snapshot
+
 # Helper functions for time-based logic
 def parse_time_slot(time_str):
     """Convert time slot string (e.g., '09:00 AM') to datetime.time object"""
-    return datetime.strptime(time_str, '%I:%M %p').time()
+    return (datetime.min + timedelta(minutes=slot_minutes(time_str))).time()
 
 def is_slot_in_past(date_str, time_str):
     """Check if a slot is in the past"""
-    try:
-        slot_datetime = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %I:%M %p')
-        return slot_datetime < datetime.now()
-    except:
-        return False
+    slot_ts = slot_timestamp(date_str, time_str)
+    return slot_ts is not None and slot_ts < now_timestamp()
 
-def is_slot_within_hour(date_str, time_str):
-    """Check if a slot is within the next hour"""
+def parse_page_cursor(value):
+    """Parse a 'slot_ts:id' page cursor from the query string (None for the first page)"""
+    slot_ts, _, appointment_id = value.partition(':')
     try:
-        slot_datetime = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %I:%M %p')
-        time_diff = slot_datetime - datetime.now()
-        return timedelta(0) < time_diff <= timedelta(hours=1)
-    except:
-        return False
+        return (int(slot_ts), appointment_id)
+    except ValueError:
+        return None
 
-def get_appointment_status(appointment):
+def format_page_cursor(cursor):
+    """Format a (slot_ts, id) page cursor for the query string"""
+    return f'{cursor[0]}:{cursor[1]}' if cursor else ''
+
+def csv_cell(value):
+    """Quote a text cell that a spreadsheet would otherwise run as a formula"""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def appointment_sort_key(appointment):
+    """Chronological sort key (slot_ts in epoch minutes; malformed slots first)"""
+    return appointment.get('slot_ts') or 0
+
+def get_appointment_status(appointment, now_ts=None):
     """
     Classify appointment status based on current time:
     - 'upcoming': future appointment
     - 'completed': past appointment with confirmed status
     - 'missed': past appointment that was not cancelled
+    Pass now_ts (from now_timestamp()) when classifying many appointments at once.
     """
-    date_str = appointment['date']
-    time_str = appointment['time']
+    slot_ts = appointment.get('slot_ts')
+    if slot_ts is None:
+        slot_ts = slot_timestamp(appointment['date'], appointment['time'])
+    if now_ts is None:
+        now_ts = now_timestamp()
     status = appointment['status']
     
-    if is_slot_in_past(date_str, time_str):
+    if slot_ts is not None and slot_ts < now_ts:
         if status == 'cancelled':
             return 'cancelled'
         elif status == 'no_show':
@@ -87,6 +150,38 @@ def get_future_slots_for_date(date_str, all_slots):
         # Future date - all slots available
         return all_slots
 
+def get_slot_maps(doctor_id, days=30, exclude=None):
+    """
+    Build the date list and the booked/past/urgent slot maps (keyed
+    "date_time") used by the booking templates, from the doctor's
+    availability bitmap. Returns (available_dates, booked_slots,
+    slot_counts, past_slots, urgent_slots).
+    """
+    available_dates = []
+    booked_slots = {}
+    slot_counts = {}
+    past_slots = {}
+    urgent_slots = {}
+    
+    for date_str, booked, past, urgent in data_handler.get_slot_availability(doctor_id, days, exclude=exclude):
+        available_dates.append(date_str)
+        if booked:
+            # Count bookings per day for status badges
+            slot_counts[date_str] = bin(booked).count('1')
+        if not (booked or past or urgent):
+            continue
+        for index, slot in enumerate(TIME_SLOTS):
+            bit = 1 << index
+            slot_key = f"{date_str}_{slot}"
+            if booked & bit:
+                booked_slots[slot_key] = True
+            if past & bit:
+                past_slots[slot_key] = True
+            elif urgent & bit:
+                urgent_slots[slot_key] = True
+    
+    return available_dates, booked_slots, slot_counts, past_slots, urgent_slots
+
 # Authentication decorators
 def patient_required(f):
     """Decorator to require patient authentication"""
@@ -102,6 +197,71 @@ def patient_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def catalog_response(key, render, mimetype='text/html', private=False):
+    """
+    Respond with content that depends only on the catalog (and, when private,
+    on the signed-in user). ETag and Last-Modified follow the catalog version,
+    so a conditional GET gets a 304 without rendering anything. Public
+    responses are also kept rendered until the catalog changes; private
+    ones are rendered again on every ETag miss, as they vary per user.
+    """
+    if private:
+        # Flashed messages are shown once: render those pages fresh
+        if '_flashes' in session:
+            return render()
+        key = (key, session.get('user_id'), session.get('user_name'), session.get('user_role'))
+    
+    version, last_modified = data_handler.catalog_version()
+    if private:
+        # Last-Modified is not per user: validate private pages by ETag only
+        last_modified = None
+    etag = hashlib.sha1(repr((version, key)).encode('utf-8')).hexdigest()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = app.response_class(status=304)
+    elif private:
+        response = app.response_class(render(), mimetype=mimetype)
+    else:
+        # Dropped automatically when the catalog changes
+        responses = data_handler.catalog_view('responses', lambda doctors, hospitals, cities: {})
+        body = responses.get(key)
+        if body is None:
+            body = render()
+            if len(responses) >= CATALOG_RESPONSE_CACHE_SIZE:
+                responses.clear()
+            responses[key] = body
+        response = app.response_class(body, mimetype=mimetype)
+    
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    if private:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = CATALOG_MAX_AGE
+    return response
+
+def hashing_busy(template):
+    """Answer 503 with Retry-After when the password hashing queue is full"""
+    flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+    return render_template(template), 503, {'Retry-After': '2'}
+
+def check_login(user, password):
+    """
+    Check a login password, upgrading the stored hash if it was made with
+    older parameters. Raises PasswordHasherBusy when the queue is full.
+    """
+    if not user or not password_hasher.verify(user['password'], password):
+        return False
+    if password_hasher.needs_rehash(user['password']):
+        try:
+            data_handler.update_user(user['id'], {'password': password_hasher.hash(password)})
+        except PasswordHasherBusy:
+            pass  # Upgrade at a quieter login
+    return True
+
 def admin_required(f):
     """Decorator to require admin authentication"""
     from functools import wraps
@@ -116,22 +276,93 @@ def admin_required(f):
 @app.route('/')
 def home():
     """Home page with city selection"""
-    cities = data_handler.get_cities()
-    return render_template('home.html', cities=cities)
+    return catalog_response(
+        'home',
+        lambda: render_template('home.html', cities=data_handler.get_cities()),
+        private=True
+    )
 
 @app.route('/api/hospitals/<city_id>')
 def get_hospitals_api(city_id):
     """API endpoint to get hospitals by city"""
-    from flask import jsonify
-    hospitals = data_handler.get_hospitals_by_city(city_id)
-    return jsonify(hospitals)
+    return catalog_response(
+        ('hospitals', city_id),
+        lambda: app.json.dumps(data_handler.get_hospitals_by_city(city_id)),
+        mimetype='application/json'
+    )
 
 @app.route('/api/doctors/<hospital_id>')
 def get_doctors_api(hospital_id):
     """API endpoint to get doctors by hospital"""
-    from flask import jsonify
-    doctors = data_handler.get_doctors_by_hospital(hospital_id)
-    return jsonify(doctors)
+    return catalog_response(
+        ('doctors', hospital_id),
+        lambda: app.json.dumps(data_handler.get_doctors_by_hospital(hospital_id)),
+        mimetype='application/json'
+    )
+
+@app.route('/api/availability')
+def get_availability_api():
+    """
+    API endpoint to get the next free slot and free slots per day for every
+    doctor in a hospital, city or specialization in one call
+    """
+    hospital_id = request.args.get('hospital_id', '')
+    city_id = request.args.get('city_id', '')
+    specialization = request.args.get('specialization', '')
+    try:
+        days = min(max(int(request.args.get('days', 7)), 1), 30)
+    except ValueError:
+        days = 7
+    
+    if hospital_id:
+        doctors = data_handler.get_doctors_by_hospital(hospital_id)
+    elif city_id:
+        doctors = []
+        for hospital in data_handler.get_hospitals_by_city(city_id):
+            doctors.extend(data_handler.get_doctors_by_hospital(hospital['id']))
+    elif specialization:
+        doctors = [d for d in data_handler.get_doctors()
+                   if d['specialization'].lower() == specialization.lower()]
+    else:
+        return jsonify({'error': 'Provide hospital_id, city_id or specialization'}), 400
+    
+    summary = data_handler.get_availability_summary([d['id'] for d in doctors], days)
+    return jsonify([
+        {
+            'doctor_id': doctor['id'],
+            'name': doctor['name'],
+            'specialization': doctor['specialization'],
+            'hospital_id': doctor.get('hospital_id'),
+            'next_available': summary[doctor['id']]['next_available'],
+            'free_slots': summary[doctor['id']]['free_slots'],
+        }
+        for doctor in doctors
+    ])
+
+@app.route('/api/autocomplete')
+def autocomplete_api():
+    """
+    API endpoint for search box suggestions: doctor names, specializations
+    and symptoms starting with q (optionally limited to comma-separated types)
+    """
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    types = tuple(t for t in request.args.get('types', '').split(',') if t in SUGGESTION_TYPES)
+    
+    types = types or SUGGESTION_TYPES
+    
+    def render():
+        completer = data_handler.catalog_view(
+            'autocomplete',
+            lambda doctors, hospitals, cities: Autocompleter(doctors, SYMPTOM_SPECIALIZATION_MAP)
+        )
+        return app.json.dumps(completer.complete(query, limit, types))
+    
+    # Repeated keystrokes revalidate cheaply: 304 until the catalog changes
+    return catalog_response(('autocomplete', query, limit, types), render, mimetype='application/json')
 
 @app.route('/select-location', methods=['POST'])
 def select_location():
@@ -154,14 +385,11 @@ def select_location():
 @patient_required
 def doctors_by_hospital(hospital_id):
     """Show all doctors in a specific hospital"""
-    hospital = data_handler.get_hospital_by_id(hospital_id)
+    hospital, city, doctors = data_handler.get_hospital_view(hospital_id)
     if not hospital:
         flash('Hospital not found!', 'danger')
         return redirect(url_for('patient_dashboard'))
     
-    city = data_handler.get_city_by_id(hospital['city_id'])
-    doctors = data_handler.get_doctors_by_hospital(hospital_id)
-    
     return render_template('doctors_by_hospital.html', 
                          doctors=doctors, 
                          hospital=hospital,
@@ -186,12 +414,17 @@ def register():
             flash('Email already registered!', 'danger')
             return redirect(url_for('register'))
         
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            return hashing_busy('register.html')
+        
         # Create new patient user
         user_data = {
             'id': str(uuid.uuid4()),
             'name': name,
             'email': email,
-            'password': generate_password_hash(password),
+            'password': password_hash,
             'phone': phone,
             'role': 'patient',  # Default role is patient
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -211,8 +444,12 @@ def login():
         password = request.form.get('password')
         
         user = data_handler.get_user_by_email(email)
+        try:
+            valid = check_login(user, password)
+        except PasswordHasherBusy:
+            return hashing_busy('login.html')
         
-        if user and check_password_hash(user['password'], password):
+        if valid:
             # Ensure patient users only
             user_role = user.get('role', 'patient')  # Default to patient for existing users
             if user_role == 'admin':
@@ -261,8 +498,9 @@ def patient_dashboard():
     completed_appointments = []
     missed_appointments = []
     
+    now_ts = now_timestamp()
     for appt in appointments:
-        time_status = get_appointment_status(appt)
+        time_status = get_appointment_status(appt, now_ts)
         if time_status == 'upcoming':
             upcoming_appointments.append(appt)
         elif time_status == 'completed':
@@ -271,8 +509,8 @@ def patient_dashboard():
             missed_appointments.append(appt)
     
     # Sort
-    upcoming_appointments.sort(key=lambda x: (x['date'], x['time']))
-    completed_appointments.sort(key=lambda x: (x['date'], x['time']), reverse=True)
+    upcoming_appointments.sort(key=appointment_sort_key)
+    completed_appointments.sort(key=appointment_sort_key, reverse=True)
     
     # Get summary stats
     total_appointments = len(appointments)
@@ -311,12 +549,17 @@ def admin_register():
             flash('Email already registered!', 'danger')
             return redirect(url_for('admin_register'))
         
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            return hashing_busy('admin_register.html')
+        
         # Create new admin user
         user_data = {
             'id': str(uuid.uuid4()),
             'name': name,
             'email': email,
-            'password': generate_password_hash(password),
+            'password': password_hash,
             'phone': phone,
             'role': 'admin',
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -336,8 +579,12 @@ def admin_login():
         password = request.form.get('password')
         
         user = data_handler.get_user_by_email(email)
+        try:
+            valid = check_login(user, password)
+        except PasswordHasherBusy:
+            return hashing_busy('admin_login.html')
         
-        if user and check_password_hash(user['password'], password):
+        if valid:
             # Ensure admin users only
             if user.get('role') != 'admin':
                 flash('Access denied. Admin credentials required.', 'danger')
@@ -363,9 +610,16 @@ def admin_dashboard():
     doctor_filter = request.args.get('doctor', '')
     date_filter = request.args.get('date', '')
     payment_status_filter = request.args.get('payment_status', '')
+    cursor = parse_page_cursor(request.args.get('cursor', ''))
     
-    # Get all appointments
-    appointments = data_handler.get_appointments()
+    # Fetch only the page being viewed, filtered and ordered latest first
+    appointments, next_cursor = data_handler.get_appointments_page(
+        doctor_id=doctor_filter or None,
+        date=date_filter or None,
+        payment_status=payment_status_filter or None,
+        after=cursor,
+        limit=ADMIN_PAGE_SIZE
+    )
     
     # Get lookup dictionaries for enrichment
     all_doctors = data_handler.get_doctors()
@@ -374,10 +628,8 @@ def admin_dashboard():
     hospitals = data_handler.get_hospitals()
     hospitals_dict = {h['id']: h for h in hospitals}
     
-    cities = data_handler.get_cities()
-    cities_dict = {c['id']: c for c in cities}
-    
     # Enrich appointments with doctor and hospital info (in case missing)
+    now_ts = now_timestamp()
     for appt in appointments:
         # Ensure doctor info is present
         if 'doctor_name' not in appt or not appt.get('doctor_name'):
@@ -392,77 +644,84 @@ def admin_dashboard():
                 appt['hospital_name'] = hospitals_dict[hospital_id]['name']
             else:
                 appt['hospital_name'] = 'Unknown Hospital'
-    
-    # Apply filters and add time-based status
-    filtered_appointments = []
-    for appt in appointments:
-        # Doctor filter - check if filter is applied and matches
-        if doctor_filter and str(appt.get('doctor_id', '')) != str(doctor_filter):
-            continue
-        
-        # Date filter - check if filter is applied and matches
-        if date_filter and appt.get('date', '') != date_filter:
-            continue
-        
-        # Payment status filter - check if filter is applied and matches
-        if payment_status_filter and appt.get('payment_status', '') != payment_status_filter:
-            continue
         
         # Add time-based status to appointment
-        appt['time_status'] = get_appointment_status(appt)
-        filtered_appointments.append(appt)
-    
-    # Sort by date and time (most recent first)
-    filtered_appointments.sort(key=lambda x: (x.get('date', ''), x.get('time', '')), reverse=True)
+        appt['time_status'] = get_appointment_status(appt, now_ts)
     
-    # Calculate statistics
-    total_bookings = len(appointments)
-    confirmed_bookings = len([a for a in appointments if a.get('status') == 'confirmed'])
-    cancelled_bookings = len([a for a in appointments if a.get('status') == 'cancelled'])
-    pending_payments = len([a for a in appointments if a.get('payment_status') == 'Pending'])
-    successful_payments = len([a for a in appointments if a.get('payment_status') == 'Success'])
-    
-    # Booking count per doctor
-    doctor_counts = {}
-    for appt in appointments:
-        doctor_name = appt.get('doctor_name', 'Unknown Doctor')
-        doctor_counts[doctor_name] = doctor_counts.get(doctor_name, 0) + 1
-    
-    # Booking count per hospital
-    hospital_counts = {}
-    for appt in appointments:
-        hospital_name = appt.get('hospital_name', 'Unknown Hospital')
-        hospital_counts[hospital_name] = hospital_counts.get(hospital_name, 0) + 1
-    
-    # Count unique doctors
-    total_doctors = len(all_doctors)
-    
-    # Count doctors per hospital
-    doctors_per_hospital = {}
-    for hospital in hospitals:
-        hospital_doctors = data_handler.get_doctors_by_hospital(hospital['id'])
-        doctors_per_hospital[hospital['name']] = len(hospital_doctors)
-    
-    stats = {
-        'total_bookings': total_bookings,
-        'confirmed_bookings': confirmed_bookings,
-        'cancelled_bookings': cancelled_bookings,
-        'pending_payments': pending_payments,
-        'successful_payments': successful_payments,
-        'doctor_counts': doctor_counts,
-        'hospital_counts': hospital_counts,
-        'total_doctors': total_doctors,
-        'doctors_per_hospital': doctors_per_hospital
-    }
+    # Statistics are maintained incrementally by the data handler
+    stats = data_handler.get_admin_stats()
     
     return render_template('admin_dashboard.html', 
-                         appointments=filtered_appointments,
+                         appointments=appointments,
+                         next_cursor=format_page_cursor(next_cursor),
+                         cursor=request.args.get('cursor', ''),
                          stats=stats,
                          doctors=all_doctors,
                          doctor_filter=doctor_filter,
                          date_filter=date_filter,
                          payment_status_filter=payment_status_filter)
 
+@app.route('/admin/export')
+@admin_required
+def admin_export():
+    """Stream appointments as CSV or NDJSON, with the dashboard's filters"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        flash('Unknown export format.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    
+    # Lazy: appointments are copied one at a time as the response is written
+    appointments = data_handler.iter_appointments(
+        doctor_id=request.args.get('doctor') or None,
+        date=request.args.get('date') or None,
+        payment_status=request.args.get('payment_status') or None
+    )
+    
+    def generate():
+        buffer = io.StringIO()
+        if export_format == 'csv':
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            # Patients type reason and user_name freely; the file ends up in spreadsheets
+            write = lambda appt: writer.writerow({field: csv_cell(appt.get(field)) for field in EXPORT_FIELDS})
+        else:
+            write = lambda appt: buffer.write(json.dumps(appt) + '\n')
+        
+        # Flush every EXPORT_BATCH rows to keep writes large and memory flat
+        for count, (_, appt) in enumerate(appointments, 1):
+            write(appt)
+            if count % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f'appointments.{export_format}'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import():
+    """Bulk import cities, hospitals or doctors from an uploaded CSV or NDJSON file"""
+    dataset = request.form.get('dataset', '')
+    upload = request.files.get('file')
+    fmt = source_format(upload.filename) if upload and upload.filename else None
+    if dataset not in CATALOG or not fmt:
+        flash('Choose cities, hospitals or doctors and a .csv or .ndjson file.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    
+    # Read the upload a row at a time rather than decoding it whole
+    f = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    imported, errors = import_catalog(data_handler, {dataset: (f, fmt)})
+    if errors:
+        more = f' (and {len(errors) - 5} more)' if len(errors) > 5 else ''
+        flash(f"Import failed, nothing was saved: {'; '.join(errors[:5])}{more}", 'danger')
+    else:
+        flash(f'Imported {imported[dataset]} {dataset}.', 'success')
+    return redirect(url_for('admin_dashboard'))
+
 @app.route('/admin/timetable')
 @admin_required
 def admin_timetable():
@@ -481,16 +740,33 @@ def admin_timetable():
     # Get selected doctor
     selected_doctor = data_handler.get_doctor_by_id(doctor_id) if doctor_id else None
     
-    # Get appointments for selected doctor and date
-    all_appointments = data_handler.get_appointments_by_doctor(doctor_id) if doctor_id else []
+    # Get active appointments for selected doctor and date, keyed by time slot
+    booked_appointments = {}
+    if doctor_id:
+        for appt in data_handler.get_appointments_by_doctor(doctor_id):
+            if (appt['date'] == date and appt['status'] in ['confirmed', 'pending_payment']
+                    and appt['time'] not in booked_appointments):
+                booked_appointments[appt['time']] = appt
+    
+    # Past slots for the selected date, from the availability bitmap
+    past_mask = 0
+    try:
+        selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+        past_mask = data_handler.get_slot_availability(doctor_id, days=1, start=selected_date)[0][2]
+    except ValueError:
+        pass
     
     # Create slot status map
     slot_status = {}
-    for time_slot in TIME_SLOTS:
-        slot_key = f"{date}_{time_slot}"
-        
-        # Check if slot is in the past
-        if is_slot_in_past(date, time_slot):
+    for index, time_slot in enumerate(TIME_SLOTS):
+        appt = booked_appointments.get(time_slot)
+        if appt:
+            appt['time_status'] = get_appointment_status(appt)
+            slot_status[time_slot] = {
+                'status': 'Booked',
+                'appointment': appt
+            }
+        elif past_mask & (1 << index):
             slot_status[time_slot] = {
                 'status': 'Past',
                 'appointment': None
@@ -500,17 +776,6 @@ def admin_timetable():
                 'status': 'Available',
                 'appointment': None
             }
-        
-        # Check if slot is booked
-        for appt in all_appointments:
-            if appt['date'] == date and appt['time'] == time_slot:
-                if appt['status'] in ['confirmed', 'pending_payment']:
-                    appt['time_status'] = get_appointment_status(appt)
-                    slot_status[time_slot] = {
-                        'status': 'Booked',
-                        'appointment': appt
-                    }
-                    break
     
     # Count bookings for selected doctor and date
     booking_count = sum(1 for slot in slot_status.values() if slot['status'] == 'Booked')
@@ -581,39 +846,26 @@ def admin_mark_paid(appointment_id):
 def doctors_list():
     """List all doctors with search functionality (Browse All)"""
     search_query = request.args.get('search', '')
-    doctors = data_handler.search_doctors(search_query)
-    
-    # Add hospital and city info to each doctor
-    hospitals = {h['id']: h for h in data_handler.get_hospitals()}
-    cities = {c['id']: c for c in data_handler.get_cities()}
-    
-    for doctor in doctors:
-        hospital_id = doctor.get('hospital_id')
-        if hospital_id and hospital_id in hospitals:
-            hospital = hospitals[hospital_id]
-            doctor['hospital_name'] = hospital['name']
-            city_id = hospital.get('city_id')
-            if city_id and city_id in cities:
-                doctor['city_name'] = cities[city_id]['name']
-    
-    return render_template('doctors_list.html', doctors=doctors, search_query=search_query)
+    # Doctors come with hospital and city names already joined
+    return catalog_response(
+        ('doctors_list', search_query),
+        lambda: render_template('doctors_list.html',
+                                doctors=data_handler.search_doctors(search_query),
+                                search_query=search_query),
+        private=True
+    )
 
 @app.route('/doctor/<doctor_id>')
 @patient_required
 def doctor_detail(doctor_id):
     """View doctor profile details"""
-    doctor = data_handler.get_doctor_by_id(doctor_id)
+    # Doctor with hospital and city info in one lookup
+    doctor, hospital, city = data_handler.get_doctor_view(doctor_id)
     
     if not doctor:
         flash('Doctor not found!', 'danger')
         return redirect(url_for('doctors_list'))
     
-    # Add hospital and city info
-    hospital = data_handler.get_hospital_by_id(doctor.get('hospital_id'))
-    city = None
-    if hospital:
-        city = data_handler.get_city_by_id(hospital.get('city_id'))
-    
     return render_template('doctor_detail.html', doctor=doctor, hospital=hospital, city=city)
 
 @app.route('/book/<doctor_id>', methods=['GET', 'POST'])
@@ -621,18 +873,13 @@ def doctor_detail(doctor_id):
 def book_appointment(doctor_id):
     """Book an appointment with a doctor"""
     
-    doctor = data_handler.get_doctor_by_id(doctor_id)
+    # Doctor with hospital and city info in one lookup
+    doctor, hospital, city = data_handler.get_doctor_view(doctor_id)
     
     if not doctor:
         flash('Doctor not found!', 'danger')
         return redirect(url_for('doctors_list'))
     
-    # Get hospital and city info
-    hospital = data_handler.get_hospital_by_id(doctor.get('hospital_id'))
-    city = None
-    if hospital:
-        city = data_handler.get_city_by_id(hospital.get('city_id'))
-    
     if request.method == 'POST':
         date = request.form.get('date')
         time = request.form.get('time')
@@ -680,34 +927,8 @@ def book_appointment(doctor_id):
             flash(message, 'danger')
             return redirect(url_for('book_appointment', doctor_id=doctor_id))
     
-    # Generate available dates (next 30 days, starting from today)
-    today = datetime.now().date()
-    available_dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(0, 30)]
-    
-    # Get booked slots for this doctor
-    doctor_appointments = data_handler.get_appointments_by_doctor(doctor_id)
-    booked_slots = {}
-    slot_counts = {}
-    past_slots = {}
-    urgent_slots = {}
-    
-    for appt in doctor_appointments:
-        if appt['status'] in ['confirmed', 'pending_payment']:
-            key = f"{appt['date']}_{appt['time']}"
-            booked_slots[key] = True
-            
-            # Count bookings per day for status badges
-            date_key = appt['date']
-            slot_counts[date_key] = slot_counts.get(date_key, 0) + 1
-    
-    # Mark past slots and urgent slots for all dates
-    for date_str in available_dates:
-        for slot in TIME_SLOTS:
-            slot_key = f"{date_str}_{slot}"
-            if is_slot_in_past(date_str, slot):
-                past_slots[slot_key] = True
-            elif is_slot_within_hour(date_str, slot):
-                urgent_slots[slot_key] = True
+    # Available dates (next 30 days, starting from today) with booked, past and urgent slots
+    available_dates, booked_slots, slot_counts, past_slots, urgent_slots = get_slot_maps(doctor_id)
     
     return render_template('book_appointment.html', 
                          doctor=doctor,
@@ -746,8 +967,9 @@ def my_appointments():
     missed_appointments = []
     cancelled_appointments = []
     
+    now_ts = now_timestamp()
     for appt in appointments:
-        time_status = get_appointment_status(appt)
+        time_status = get_appointment_status(appt, now_ts)
         appt['time_status'] = time_status  # Add to appointment for template use
         
         if time_status == 'upcoming':
@@ -760,10 +982,10 @@ def my_appointments():
             cancelled_appointments.append(appt)
     
     # Sort each category by date and time
-    upcoming_appointments.sort(key=lambda x: (x['date'], x['time']))
-    completed_appointments.sort(key=lambda x: (x['date'], x['time']), reverse=True)
-    missed_appointments.sort(key=lambda x: (x['date'], x['time']), reverse=True)
-    cancelled_appointments.sort(key=lambda x: (x['date'], x['time']), reverse=True)
+    upcoming_appointments.sort(key=appointment_sort_key)
+    completed_appointments.sort(key=appointment_sort_key, reverse=True)
+    missed_appointments.sort(key=appointment_sort_key, reverse=True)
+    cancelled_appointments.sort(key=appointment_sort_key, reverse=True)
     
     return render_template('my_appointments.html', 
                          upcoming_appointments=upcoming_appointments,
@@ -822,53 +1044,21 @@ def reschedule_appointment(appointment_id):
             flash('Please select both date and time.', 'danger')
             return redirect(url_for('reschedule_appointment', appointment_id=appointment_id))
         
-        # Check if new slot is available
-        if data_handler.is_slot_booked(appointment['doctor_id'], new_date, new_time):
-            flash('Selected time slot is not available. Please choose another slot.', 'danger')
-            return redirect(url_for('reschedule_appointment', appointment_id=appointment_id))
-        
-        # Update appointment with new date and time
-        update_data = {
-            'date': new_date,
-            'time': new_time,
-            'rescheduled_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        success = data_handler.update_appointment(appointment_id, update_data)
+        # Check the new slot and move the appointment in one atomic operation
+        success, message = data_handler.atomic_reschedule(appointment_id, new_date, new_time)
         
         if success:
-            flash('Appointment rescheduled successfully!', 'success')
+            flash(message, 'success')
             return redirect(url_for('my_appointments'))
         else:
-            flash('Failed to reschedule appointment.', 'danger')
-    
-    # Generate available dates (next 30 days, starting from today)
-    today = datetime.now().date()
-    available_dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(0, 30)]
-    
-    # Get booked slots for this doctor
-    doctor_appointments = data_handler.get_appointments_by_doctor(appointment['doctor_id'])
-    booked_slots = {}
-    past_slots = {}
-    urgent_slots = {}
-    
-    for appt in doctor_appointments:
-        # Exclude current appointment from booked slots (since it will be released)
-        if appt['id'] == appointment_id:
-            continue
-            
-        if appt['status'] in ['confirmed', 'pending_payment']:
-            key = f"{appt['date']}_{appt['time']}"
-            booked_slots[key] = True
+            flash(message, 'danger')
+            return redirect(url_for('reschedule_appointment', appointment_id=appointment_id))
     
-    # Mark past slots
-    for date_str in available_dates:
-        for slot in TIME_SLOTS:
-            slot_key = f"{date_str}_{slot}"
-            if is_slot_in_past(date_str, slot):
-                past_slots[slot_key] = True
-            elif is_slot_within_hour(date_str, slot):
-                urgent_slots[slot_key] = True
+    # Available dates (next 30 days), excluding the current appointment
+    # from booked slots since it will be released
+    available_dates, booked_slots, _, past_slots, urgent_slots = get_slot_maps(
+        appointment['doctor_id'], exclude=appointment
+    )
     
     return render_template('reschedule_appointment.html',
                          appointment=appointment,
@@ -1025,6 +1215,22 @@ SYMPTOM_SPECIALIZATION_MAP = {
     'blood pressure': ['General Physician', 'Cardiologist'],
 }
 
+# Possible causes shown with the recommendations
+POSSIBLE_CAUSES_MAP = {
+    'fever': ['Viral infection', 'Bacterial infection', 'Flu', 'COVID-19'],
+    'chest pain': ['Heart disease', 'Anxiety', 'Muscle strain', 'Acid reflux'],
+    'skin rash': ['Allergic reaction', 'Eczema', 'Contact dermatitis', 'Fungal infection'],
+    'anxiety': ['Stress', 'Depression', 'Panic disorder', 'PTSD'],
+    'back pain': ['Muscle strain', 'Poor posture', 'Herniated disk', 'Arthritis'],
+    'headache': ['Tension', 'Migraine', 'Dehydration', 'Eye strain'],
+    'cough': ['Cold', 'Flu', 'Allergies', 'Asthma'],
+    'joint pain': ['Arthritis', 'Injury', 'Overuse', 'Infection'],
+}
+
+# Compiled once: matching a symptom description is one pass over its words
+SYMPTOM_MATCHER = SymptomMatcher(SYMPTOM_SPECIALIZATION_MAP)
+CAUSES_MATCHER = SymptomMatcher(POSSIBLE_CAUSES_MAP)
+
 @app.route('/find-doctor', methods=['GET', 'POST'])
 @patient_required
 def find_doctor():
@@ -1046,37 +1252,18 @@ def find_doctor():
         hospital_filter = request.form.get('hospital_id', '')
         
         if symptom_input:
-            # Find matching specializations
-            matched_specs = set()
-            for symptom_key, specs in SYMPTOM_SPECIALIZATION_MAP.items():
-                if symptom_key in symptom_input or symptom_input in symptom_key:
-                    matched_specs.update(specs)
+            # Find matching specializations, best match first
+            spec_scores = dict(SYMPTOM_MATCHER.score(symptom_input))
             
-            if matched_specs:
-                recommended_specializations = list(matched_specs)
-                
-                # Get all doctors
-                all_doctors = data_handler.get_doctors()
-                
-                # Filter by city/hospital if selected
-                if hospital_filter:
-                    all_doctors = [d for d in all_doctors if d.get('hospital_id') == hospital_filter]
-                elif city_filter:
-                    city_hospitals = data_handler.get_hospitals_by_city(city_filter)
-                    hospital_ids = [h['id'] for h in city_hospitals]
-                    all_doctors = [d for d in all_doctors if d.get('hospital_id') in hospital_ids]
+            # Location filter: a hospital takes precedence over its city
+            location = {'hospital_id': hospital_filter} if hospital_filter else {'city_id': city_filter or None}
+            
+            if spec_scores:
+                recommended_specializations = list(spec_scores)
                 
-                # Filter doctors by specialization
-                for doctor in all_doctors:
-                    if doctor['specialization'] in matched_specs:
-                        # Add hospital and city info
-                        hospital = data_handler.get_hospital_by_id(doctor.get('hospital_id'))
-                        if hospital:
-                            doctor['hospital_name'] = hospital['name']
-                            city = data_handler.get_city_by_id(hospital.get('city_id'))
-                            if city:
-                                doctor['city_name'] = city['name']
-                        recommended_doctors.append(doctor)
+                # Doctors with hospital and city names joined, most relevant specialization first
+                recommended_doctors = data_handler.find_doctors(specializations=spec_scores, **location)
+                recommended_doctors.sort(key=lambda d: -spec_scores[d['specialization']])
                 
                 # Generate possible causes based on symptom
                 possible_causes = generate_possible_causes(symptom_input)
@@ -1085,22 +1272,12 @@ def find_doctor():
                     flash('No doctors found for this symptom in the selected location. Try expanding your search.', 'info')
             else:
                 flash('No specific specialization found. Showing general physicians.', 'info')
-                all_doctors = data_handler.get_doctors()
-                
-                # Filter by location
-                if hospital_filter:
-                    all_doctors = [d for d in all_doctors if d.get('hospital_id') == hospital_filter]
-                elif city_filter:
-                    city_hospitals = data_handler.get_hospitals_by_city(city_filter)
-                    hospital_ids = [h['id'] for h in city_hospitals]
-                    all_doctors = [d for d in all_doctors if d.get('hospital_id') in hospital_ids]
-                
-                for doctor in all_doctors:
-                    if 'general' in doctor['specialization'].lower() or 'physician' in doctor['specialization'].lower():
-                        recommended_doctors.append(doctor)
+                general_specs = [spec for spec in data_handler.get_specializations()
+                                 if 'general' in spec.lower() or 'physician' in spec.lower()]
+                recommended_doctors = data_handler.find_doctors(specializations=general_specs, **location)
                 
                 if not recommended_doctors:
-                    recommended_doctors = all_doctors[:10]  # Show first 10
+                    recommended_doctors = data_handler.find_doctors(**location)[:10]  # Show first 10
     
     # Get predefined symptoms for the UI
     predefined_symptoms = list(SYMPTOM_SPECIALIZATION_MAP.keys())
@@ -1122,24 +1299,48 @@ def find_doctor():
                          hospital_filter=hospital_filter)
 
 def generate_possible_causes(symptom):
-    """Generate possible causes for symptoms"""
-    causes_map = {
-        'fever': ['Viral infection', 'Bacterial infection', 'Flu', 'COVID-19'],
-        'chest pain': ['Heart disease', 'Anxiety', 'Muscle strain', 'Acid reflux'],
-        'skin rash': ['Allergic reaction', 'Eczema', 'Contact dermatitis', 'Fungal infection'],
-        'anxiety': ['Stress', 'Depression', 'Panic disorder', 'PTSD'],
-        'back pain': ['Muscle strain', 'Poor posture', 'Herniated disk', 'Arthritis'],
-        'headache': ['Tension', 'Migraine', 'Dehydration', 'Eye strain'],
-        'cough': ['Cold', 'Flu', 'Allergies', 'Asthma'],
-        'joint pain': ['Arthritis', 'Injury', 'Overuse', 'Infection'],
-    }
-    
-    # Find matching causes
-    for key, causes in causes_map.items():
-        if key in symptom or symptom in key:
-            return causes
-    
-    return ['Please consult a doctor for accurate diagnosis']
+    """Generate possible causes for every symptom mentioned"""
+    causes = CAUSES_MATCHER.values_for(symptom)
+    return causes or ['Please consult a doctor for accurate diagnosis']
+
+@app.cli.command('import-catalog')
+@click.option('--cities', type=click.Path(exists=True, dir_okay=False), help='Cities CSV or NDJSON')
+@click.option('--hospitals', type=click.Path(exists=True, dir_okay=False), help='Hospitals CSV or NDJSON')
+@click.option('--doctors', type=click.Path(exists=True, dir_okay=False), help='Doctors CSV or NDJSON')
+def import_catalog_command(**paths):
+    """Bulk import cities, hospitals and doctors; all or nothing"""
+    with ExitStack() as stack:
+        sources = {}
+        for dataset, path in paths.items():
+            if not path:
+                continue
+            fmt = source_format(path)
+            if not fmt:
+                raise click.BadParameter(f'{path}: expected a .csv or .ndjson file', param_hint=f'--{dataset}')
+            sources[dataset] = (stack.enter_context(open(path, 'r', encoding='utf-8-sig', newline='')), fmt)
+        if not sources:
+            raise click.UsageError('Give at least one of --cities, --hospitals, --doctors')
+        
+        imported, errors = import_catalog(data_handler, sources)
+    
+    if errors:
+        for error in errors:
+            click.echo(error, err=True)
+        raise click.ClickException(f'{len(errors)} invalid row(s); nothing was imported')
+    for dataset, count in imported.items():
+        print(f'Imported {count} {dataset}')
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """Recount the admin dashboard statistics in every running worker"""
+    stats = data_handler.rebuild_admin_stats()
+    print(f"Recounted {stats['total_bookings']} appointment(s); running workers recount on their next request")
+
+@app.cli.command('backfill-slot-timestamps')
+def backfill_slot_timestamps():
+    """Persist slot_ts on stored appointments created before it existed"""
+    count = data_handler.backfill_slot_timestamps()
+    print(f'Backfilled slot_ts on {count} appointment(s)')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
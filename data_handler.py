@@ -1,160 +1,1123 @@
-import json
+import hashlib
 import os
-from datetime import datetime
+import sys
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import date as Date, datetime, timezone
+from functools import lru_cache
+from itertools import chain
+from operator import attrgetter, methodcaller
 import threading
+from contextlib import contextmanager
+from search import DoctorFacets, DoctorSearchIndex
+from storage import (LOCK_STRIPES, JSONBackend, StorageBackend, create_backend, hold_all,
+                     lock_stripe, read_json_file, write_json_file)
+
+EPOCH_ORDINAL = Date(1970, 1, 1).toordinal()
+
+@lru_cache(maxsize=256)
+def slot_minutes(time_str):
+    """Minutes after midnight of a slot string like '09:00 AM' (parsed once per distinct string)"""
+    slot_time = datetime.strptime(time_str, '%I:%M %p')
+    return slot_time.hour * 60 + slot_time.minute
+
+def slot_timestamp(date_str, time_str):
+    """
+    Canonical slot time in epoch minutes on the local wall clock, or None
+    if the date or time is malformed. Sorts chronologically, unlike the
+    (date, time) strings where '02:00 PM' sorts before '09:00 AM'.
+    """
+    try:
+        return (Date.fromisoformat(date_str).toordinal() - EPOCH_ORDINAL) * 1440 + slot_minutes(time_str)
+    except (TypeError, ValueError):
+        return None
+
+def now_timestamp(now=None):
+    """Current local time in epoch minutes, with seconds as a fraction"""
+    now = now or datetime.now()
+    return ((now.toordinal() - EPOCH_ORDINAL) * 1440 + now.hour * 60 + now.minute
+            + now.second / 60 + now.microsecond / 60000000)
+
+# Marks an interned field in Record.CONVERSIONS
+INTERN = object()
+
+class Record:
+    """
+    Compact, read-only record held in the cache. Every known field has a
+    slot, None when the stored record lacks it (nulls lists the fields
+    stored as an explicit null), and unknown keys live in extra. Hot loops
+    read attributes (record.status); everything else can treat it like a
+    dict (record['id'], record.get('status'), dict(record)). Callers get
+    to_dict() copies.
+    """
+    
+    __slots__ = ('extra', 'nulls')
+    FIELDS = ()
+    # Fields with few distinct values, interned so records share one string
+    INTERNED = ()
+    # Enum-like fields: field -> allowed values; stored strings are replaced
+    # by these constants (an unexpected value is kept as it is)
+    CHOICES = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+        cls.VALUES = attrgetter(*cls.FIELDS)
+        canonical = {field: {value: value for value in values} for field, values in cls.CHOICES.items()}
+        # (field, conversion) per field: canonical values, INTERN, or None
+        cls.CONVERSIONS = tuple(
+            (field, canonical.get(field) or (INTERN if field in cls.INTERNED else None))
+            for field in cls.FIELDS
+        )
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict as stored on disk"""
+        record = cls.__new__(cls)
+        get = data.get
+        nulls = None
+        for field, conversion in cls.CONVERSIONS:
+            value = get(field)
+            if value is None:
+                if field in data:
+                    nulls = (nulls or ()) + (field,)
+            elif conversion is not None and type(value) is str:
+                value = sys.intern(value) if conversion is INTERN else conversion.get(value, value)
+            setattr(record, field, value)
+        record.nulls = nulls
+        record.extra = None
+        if not cls.FIELD_SET.issuperset(data):
+            record.extra = {key: value for key, value in data.items() if key not in cls.FIELD_SET}
+        return record
+    
+    def to_dict(self):
+        """A plain dict copy of the record"""
+        data = {field: value for field, value in zip(self.FIELDS, self.VALUES(self)) if value is not None}
+        if self.nulls:
+            data.update(dict.fromkeys(self.nulls))
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def get(self, key, default=None):
+        if key in self.FIELD_SET:
+            value = getattr(self, key)
+            if value is None and not (self.nulls and key in self.nulls):
+                return default
+            return value
+        return self.extra.get(key, default) if self.extra else default
+    
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        return self.get(key, KeyError) is not KeyError
+    
+    def keys(self):
+        return list(self.to_dict())
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+class User(Record):
+    FIELDS = ('id', 'name', 'email', 'password', 'phone', 'role', 'created_at')
+    INTERNED = ('role',)
+    __slots__ = FIELDS
+
+class City(Record):
+    FIELDS = ('id', 'name', 'state')
+    INTERNED = ('state',)
+    __slots__ = FIELDS
+
+class Hospital(Record):
+    FIELDS = ('id', 'name', 'city_id', 'address', 'phone', 'specialties')
+    INTERNED = ('city_id',)
+    __slots__ = FIELDS
+
+class Doctor(Record):
+    FIELDS = ('id', 'name', 'specialization', 'department', 'qualification', 'experience',
+              'fees', 'hospital_id', 'email', 'phone', 'image', 'about')
+    INTERNED = ('specialization', 'department', 'qualification', 'experience', 'hospital_id')
+    __slots__ = FIELDS
+
+# Appointment status values (Appointment.CHOICES)
+APPOINTMENT_STATUSES = ('pending_payment', 'confirmed', 'cancelled', 'no_show')
+PAYMENT_STATUSES = ('Pending', 'Success', 'Failed', 'Refunded')
+
+class Appointment(Record):
+    FIELDS = ('id', 'user_id', 'user_email', 'user_name', 'doctor_id', 'doctor_name',
+              'hospital_id', 'hospital_name', 'city_id', 'city_name', 'date', 'time',
+              'slot_ts', 'reason', 'status', 'booked_at', 'payment_status', 'payment_method',
+              'payment_input', 'transaction_id', 'paid_at', 'refunded_at', 'cancelled_at',
+              'no_show_at', 'rescheduled_at')
+    # A patient's or doctor's details repeat across all of their appointments
+    INTERNED = ('user_id', 'user_email', 'user_name', 'doctor_id', 'doctor_name', 'hospital_id',
+                'hospital_name', 'city_id', 'city_name', 'date', 'time', 'payment_method')
+    CHOICES = {
+        'status': APPOINTMENT_STATUSES,
+        'payment_status': PAYMENT_STATUSES,
+    }
+    __slots__ = FIELDS
+
+class CachedDataset:
+    """
+    In-memory copy of one JSON file with hash indexes, tagged with its stat signature.
+    Records are never mutated in place: updates swap in a new Record, so
+    readers holding a record always see a consistent version.
+    """
+    
+    def __init__(self, signature, records, unique_keys=('id',), group_keys=(), aggregates=None,
+                 record_type=None):
+        self.signature = signature
+        # Rebuild marker the dataset was loaded under (DataHandler.rebuild_generation)
+        self.generation = None
+        # Indexed keys read as attributes of record_type records, else through get()
+        self.readers = {
+            key: attrgetter(key) if record_type else methodcaller('get', key)
+            for key in {'id', *unique_keys, *group_keys}
+        }
+        self.record_id = self.readers['id']
+        # Signatures of our own writes applied out of order: before -> after
+        self.pending = {}
+        self.records = []
+        self.positions = {}
+        # unique key -> {value: record}, group key -> {value: {record id: record}}
+        self.unique = {key: {} for key in unique_keys}
+        self.groups = {key: {} for key in group_keys}
+        self.aggregates = {}
+        for record in records:
+            self.add(record)
+        
+        # Derived structures kept in step with the records: name -> object
+        # with build(records), add(record) and remove(record)
+        for name, factory in (aggregates or {}).items():
+            aggregate = factory()
+            aggregate.build(self.records)
+            self.aggregates[name] = aggregate
+    
+    def add(self, record):
+        """Append a record and index it"""
+        self.positions[self.record_id(record)] = len(self.records)
+        self.records.append(record)
+        self._index(record)
+    
+    def upsert(self, record):
+        """Add a record, or replace the version with the same ID"""
+        if self.record_id(record) in self.positions:
+            self.replace(record)
+        else:
+            self.add(record)
+    
+    def replace(self, record):
+        """Swap in a new version of an existing record and re-index it"""
+        position = self.positions[self.record_id(record)]
+        self._unindex(self.records[position])
+        self.records[position] = record
+        self._index(record)
+    
+    def _index(self, record):
+        readers, record_id = self.readers, self.record_id(record)
+        for key, index in self.unique.items():
+            # First record wins, matching the old linear-scan lookups
+            index.setdefault(readers[key](record), record)
+        for key, index in self.groups.items():
+            index.setdefault(readers[key](record), {})[record_id] = record
+        for aggregate in self.aggregates.values():
+            aggregate.add(record)
+    
+    def _unindex(self, record):
+        readers, record_id = self.readers, self.record_id(record)
+        for key, index in self.unique.items():
+            value = readers[key](record)
+            indexed = index.get(value)
+            if indexed is not None and self.record_id(indexed) == record_id:
+                del index[value]
+        for key, index in self.groups.items():
+            group = index.get(readers[key](record))
+            if group is not None:
+                group.pop(record_id, None)
+        for aggregate in self.aggregates.values():
+            aggregate.remove(record)
+
+class SlotAvailability:
+    """
+    Per-doctor bitmap of booked time slots, keyed by date ordinal.
+    Bit i of a day's mask is set while an active appointment holds
+    time_slots[i], so a day's availability is one dict lookup.
+    """
+    
+    ACTIVE_STATUSES = ('confirmed', 'pending_payment')
+    
+    def __init__(self, time_slots):
+        self.time_slots = tuple(time_slots)
+        self.slot_index = {slot: i for i, slot in enumerate(self.time_slots)}
+        # Minutes after midnight of each slot, parsed once up front
+        self.slot_minutes = [slot_minutes(slot) for slot in self.time_slots]
+        self.full_mask = (1 << len(self.time_slots)) - 1
+        
+        self.masks = {}   # doctor_id -> {date ordinal: booked mask}
+        self.holders = {}  # (doctor_id, ordinal, slot index) -> active appointments on it
+    
+    def slot_key(self, record):
+        """(doctor_id, ordinal, slot index) held by an active record, else None"""
+        if record.status not in self.ACTIVE_STATUSES:
+            return None
+        index = self.slot_index.get(record.time)
+        ordinal = self.date_ordinal(record.date)
+        if index is None or ordinal is None:
+            return None
+        return (record.doctor_id, ordinal, index)
+    
+    def date_ordinal(self, date_str):
+        """Day ordinal of a 'YYYY-MM-DD' string, or None if it is malformed"""
+        try:
+            return Date.fromisoformat(date_str).toordinal()
+        except (TypeError, ValueError):
+            return None
+    
+    def build(self, records):
+        """Index every loaded record"""
+        for record in records:
+            self.add(record)
+    
+    def add(self, record):
+        """Mark a record's slot as booked if the record is active"""
+        key = self.slot_key(record)
+        if key is None:
+            return
+        doctor_id, ordinal, index = key
+        self.holders[key] = self.holders.get(key, 0) + 1
+        days = self.masks.setdefault(doctor_id, {})
+        days[ordinal] = days.get(ordinal, 0) | (1 << index)
+    
+    def remove(self, record):
+        """Release a record's slot once no other active record holds it"""
+        key = self.slot_key(record)
+        if key is None:
+            return
+        doctor_id, ordinal, index = key
+        remaining = self.holders.get(key, 0) - 1
+        if remaining > 0:
+            self.holders[key] = remaining
+            return
+        self.holders.pop(key, None)
+        days = self.masks.get(doctor_id, {})
+        mask = days.get(ordinal, 0) & ~(1 << index)
+        if mask:
+            days[ordinal] = mask
+        else:
+            days.pop(ordinal, None)
+    
+    def booked_mask(self, doctor_id, ordinal):
+        """Bitmask of booked slots for a doctor on one day"""
+        return self.masks.get(doctor_id, {}).get(ordinal, 0)
+    
+    def time_masks(self, ordinal, now):
+        """
+        Return (past_mask, urgent_mask) for one day: slots already started,
+        and slots starting within the next hour
+        """
+        now_minutes = now.toordinal() * 1440 + now.hour * 60 + now.minute + now.second / 60
+        day_start = ordinal * 1440
+        past_mask = urgent_mask = 0
+        for index, minutes in enumerate(self.slot_minutes):
+            until_slot = day_start + minutes - now_minutes
+            if until_slot < 0:
+                past_mask |= 1 << index
+            elif 0 < until_slot <= 60:
+                urgent_mask |= 1 << index
+        return past_mask, urgent_mask
+    
+    def days(self, doctor_id, start_ordinal, count, now, exclude=None):
+        """
+        Yield (ordinal, booked_mask, past_mask, urgent_mask) for `count`
+        consecutive days starting at start_ordinal. The slot held by the
+        `exclude` record (e.g. one being rescheduled) is reported free.
+        """
+        booked = self.masks.get(doctor_id, {})
+        released = self.slot_key(exclude) if exclude else None
+        if released is not None and self.holders.get(released, 0) > 1:
+            released = None
+        today = now.toordinal()
+        for ordinal in range(start_ordinal, start_ordinal + count):
+            if ordinal < today - 1:
+                past_mask, urgent_mask = self.full_mask, 0
+            elif ordinal > today + 1:
+                past_mask = urgent_mask = 0
+            else:
+                past_mask, urgent_mask = self.time_masks(ordinal, now)
+            booked_mask = booked.get(ordinal, 0)
+            if released is not None and released[:2] == (doctor_id, ordinal):
+                booked_mask &= ~(1 << released[2])
+            yield ordinal, booked_mask, past_mask, urgent_mask
+
+class SlotTimeline:
+    """Appointments as a sorted list of (slot_ts, id), for range queries by slot time"""
+    
+    def __init__(self):
+        self.entries = []
+    
+    def entry(self, record):
+        # Malformed slots sort first
+        return (record.slot_ts or 0, record.id)
+    
+    def build(self, records):
+        """Sort every loaded record once"""
+        self.entries = sorted(self.entry(record) for record in records)
+    
+    def add(self, record):
+        """Insert a record at its slot time"""
+        insort(self.entries, self.entry(record))
+    
+    def remove(self, record):
+        """Remove a record's entry"""
+        entry = self.entry(record)
+        index = bisect_left(self.entries, entry)
+        if index < len(self.entries) and self.entries[index] == entry:
+            del self.entries[index]
+    
+    def between(self, start, end):
+        """(slot_ts, id) entries with start <= slot_ts < end, in slot order"""
+        return self.entries[bisect_left(self.entries, (start,)):bisect_left(self.entries, (end,))]
+    
+    def before(self, cursor, start=float('-inf'), chunk=256):
+        """
+        Yield (slot_ts, id) entries below cursor with slot_ts >= start, latest
+        first. Each slice is re-anchored on the last entry yielded, so writers
+        inserting or removing entries meanwhile cannot cause skips or repeats.
+        """
+        while True:
+            entries = self.entries
+            lower = bisect_left(entries, (start,))
+            end = bisect_left(entries, cursor)
+            if end <= lower:
+                return
+            block = entries[max(lower, end - chunk):end]
+            yield from reversed(block)
+            cursor = block[0]
+
+class AppointmentStats:
+    """
+    Running admin dashboard counts over every appointment. Each book, cancel,
+    payment, no-show or refund is a remove of the old record and an add of
+    the new one, so the counts stay exact without rescanning.
+    """
+    
+    def __init__(self):
+        self.total = 0
+        self.statuses = Counter()
+        self.payment_statuses = Counter()
+        # Keyed by (id, stored name): names are resolved against the catalog on read
+        self.doctors = Counter()
+        self.hospitals = Counter()
+    
+    def build(self, records):
+        """Count every loaded record"""
+        for record in records:
+            self.add(record)
+    
+    def counters(self, record):
+        return (
+            (self.statuses, record.status),
+            (self.payment_statuses, record.payment_status),
+            (self.doctors, (record.doctor_id, record.doctor_name)),
+            (self.hospitals, (record.hospital_id, record.hospital_name)),
+        )
+    
+    def add(self, record):
+        """Count a record"""
+        self.total += 1
+        for counter, key in self.counters(record):
+            counter[key] += 1
+    
+    def remove(self, record):
+        """Stop counting a record"""
+        self.total -= 1
+        for counter, key in self.counters(record):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+    
+    def snapshot(self):
+        """Copy of the counts (caller holds the cache lock)"""
+        return {
+            'total': self.total,
+            'statuses': dict(self.statuses),
+            'payment_statuses': dict(self.payment_statuses),
+            'doctors': dict(self.doctors),
+            'hospitals': dict(self.hospitals),
+        }
 
 class DataHandler:
-    """Handler for JSON file operations with slot locking"""
+    """Handler for data operations with slot locking, backed by a pluggable StorageBackend"""
     
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', backend=None, time_slots=(), codec=None):
         self.data_dir = data_dir
+        self.time_slots = tuple(time_slots)
         self.users_file = os.path.join(data_dir, 'users.json')
         self.doctors_file = os.path.join(data_dir, 'doctors.json')
         self.appointments_file = os.path.join(data_dir, 'appointments.json')
         self.cities_file = os.path.join(data_dir, 'cities.json')
         self.hospitals_file = os.path.join(data_dir, 'hospitals.json')
         
-        # Thread lock for atomic operations
-        self.lock = threading.Lock()
+        # Striped thread locks for atomic operations: writes are keyed by
+        # doctor ID (appointments) or user ID (users), so bookings for
+        # different doctors do not wait on each other. Catalog datasets are
+        # only written by bulk imports, which take every stripe
+        self.stripe_locks = {
+            name: [threading.Lock() for _ in range(LOCK_STRIPES)]
+            for name in ('users', 'doctors', 'hospitals', 'cities', 'appointments')
+        }
         
         # Create data directory if it doesn't exist
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
+        
+        # Storage backend: a StorageBackend instance or a name ('json', 'sqlite', 'journal'),
+        # writing JSON through codec (orjson if installed, compact; see storage.get_codec)
+        if backend is None:
+            backend = JSONBackend(data_dir, codec)
+        elif not isinstance(backend, StorageBackend):
+            backend = create_backend(backend, data_dir, codec)
+        self.backend = backend
+        self.codec = backend.codec
+        
+        # Read-through cache of every dataset with its (unique keys, group keys) indexes
+        self.index_keys = {
+            'users': (('id', 'email'), ()),
+            'doctors': (('id',), ('hospital_id',)),
+            'hospitals': (('id',), ('city_id',)),
+            'cities': (('id',), ()),
+            'appointments': (('id',), ('doctor_id', 'user_email')),
+        }
+        # Aggregates maintained incrementally alongside each dataset's indexes
+        self.aggregate_factories = {
+            'appointments': {
+                'availability': lambda: SlotAvailability(self.time_slots),
+                'timeline': SlotTimeline,
+                'stats': AppointmentStats,
+            },
+        }
+        # Compact record classes the cache holds instead of dicts
+        self.record_types = {
+            'users': User,
+            'doctors': Doctor,
+            'hospitals': Hospital,
+            'cities': City,
+            'appointments': Appointment,
+        }
+        # Derived fields filled in on every record as it is loaded or written
+        self.normalizers = {
+            'appointments': self.with_slot_timestamp,
+        }
+        self._cache = {}
+        # Guards cache reloads and the short commit step of every write, so a
+        # reload can never drop a record that is being committed
+        self._cache_lock = threading.RLock()
+        # Request-scoped snapshot: a callable returning the dict of datasets
+        # read so far in the current request, or None outside one (set by the app)
+        self.snapshot_store = None
+        self._local = threading.local()
+        # Structures derived from the whole catalog: name -> (datasets built from, structure)
+        self._catalog_views = {}
+        self._catalog_lock = threading.Lock()
     
     def read_json(self, filename):
         """Read data from JSON file"""
-        if not os.path.exists(filename):
-            return []
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
+        return read_json_file(filename, self.codec)
     
     def write_json(self, filename, data):
-        """Write data to JSON file"""
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+        """Write data to JSON file (atomically)"""
+        write_json_file(filename, data, self.codec)
+    
+    # Cache and indexes
+    def load_cached(self, name):
+        """
+        Return the dataset as already read in the current request's snapshot,
+        or else revalidate the cache: each dataset is checked at most once
+        per request
+        """
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            return self.revalidate(name)
+        dataset = snapshot.get(name)
+        if dataset is None:
+            dataset = snapshot[name] = self.revalidate(name)
+        return dataset
+    
+    def current_snapshot(self):
+        """
+        The request snapshot to read through, or None outside a request and
+        inside write_locks, where checks must see the latest data
+        """
+        if self.snapshot_store is None or getattr(self._local, 'writing', 0):
+            return None
+        return self.snapshot_store()
+    
+    def forget_snapshot(self, name):
+        """Drop a dataset from the request snapshot so the next read sees our write"""
+        snapshot = self.snapshot_store() if self.snapshot_store is not None else None
+        if snapshot is not None:
+            snapshot.pop(name, None)
+    
+    def revalidate(self, name):
+        """
+        Return the cached dataset, catching it up with the records written
+        since it was loaded when the backend reports a change, or else
+        re-loading and re-indexing it
+        """
+        signature = self.backend.signature(name)
+        generation = self.rebuild_generation(name)
+        dataset = self._cache.get(name)
+        if dataset is not None and dataset.signature == signature and dataset.generation == generation:
+            return dataset
+        
+        with self._cache_lock:
+            # Read again under the lock: every write patched in so far is
+            # then included, so the pending chain can be dropped below
+            signature = self.backend.signature(name)
+            dataset = self._cache.get(name)
+            if dataset is not None and dataset.signature == signature and dataset.generation == generation:
+                return dataset
+            
+            if dataset is not None and dataset.generation == generation:
+                # Records written after the signature taken here are applied
+                # again on the next catch-up, which is harmless
+                changes = self.backend.changes(name, dataset.signature)
+                if changes is not None:
+                    for record in self.to_records(name, changes):
+                        dataset.upsert(record)
+                    dataset.signature = signature
+                    dataset.pending.clear()
+                    return dataset
+            
+            # Signature taken before loading: if the data changes in
+            # between, the next call sees a new signature and reloads again
+            unique_keys, group_keys = self.index_keys.get(name, (('id',), ()))
+            records = self.to_records(name, self.backend.load(name))
+            dataset = CachedDataset(signature, records, unique_keys, group_keys,
+                                    self.aggregate_factories.get(name), self.record_types.get(name))
+            dataset.generation = generation
+            self._cache[name] = dataset
+            return dataset
+    
+    def to_records(self, name, records):
+        """Normalize stored dicts and convert them to the dataset's record type"""
+        normalize = self.normalizers.get(name)
+        if normalize:
+            records = [normalize(record) for record in records]
+        record_type = self.record_types.get(name)
+        if record_type:
+            records = [record_type.from_dict(record) for record in records]
+        return records
+    
+    def rebuild_marker(self, name):
+        """Path of the file whose replacement makes every worker rebuild a dataset"""
+        return os.path.join(self.data_dir, f'.{name}.rebuild')
+    
+    def rebuild_generation(self, name):
+        """Stat of the rebuild marker (None until a rebuild is requested)"""
+        try:
+            stat = os.stat(self.rebuild_marker(name))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+    
+    def request_rebuild(self, name):
+        """
+        Make every process re-load and re-index a dataset from scratch on its
+        next read, as if it had changed on disk (the cache of this process
+        is dropped now)
+        """
+        # An atomic replace gives the marker a new inode even within one mtime tick
+        requested_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        write_json_file(self.rebuild_marker(name), {'requested_at': requested_at}, self.codec)
+        self.invalidate_cache(name)
+    
+    def invalidate_cache(self, name=None):
+        """Drop the cached dataset for one dataset (or all of them)"""
+        with self._cache_lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+        snapshot = self.snapshot_store() if self.snapshot_store is not None else None
+        if snapshot is not None:
+            if name is None:
+                snapshot.clear()
+            else:
+                snapshot.pop(name, None)
+    
+    def read_records(self, name):
+        """Get a private copy of every record in a dataset"""
+        return [record.to_dict() for record in self.load_cached(name).records]
+    
+    def find_record(self, name, key, value):
+        """Get a copy of the record whose unique key matches value"""
+        record = self.load_cached(name).unique[key].get(value)
+        return record.to_dict() if record is not None else None
+    
+    def filter_records(self, name, key, value):
+        """Get copies of all records whose group key matches value"""
+        group = self.load_cached(name).groups[key].get(value, {})
+        # Snapshot the values first: a writer may be adding to this group
+        return [record.to_dict() for record in tuple(group.values())]
+    
+    def catalog_view(self, name, build):
+        """
+        A structure derived from the catalog, built by build(doctors, hospitals,
+        cities) from the cached records and rebuilt only after one of the three
+        datasets changes. build must not modify the records.
+        """
+        datasets = tuple(self.load_cached(dataset) for dataset in ('doctors', 'hospitals', 'cities'))
+        cached = self._catalog_views.get(name)
+        if cached is None or any(old is not new for old, new in zip(cached[0], datasets)):
+            with self._catalog_lock:
+                cached = self._catalog_views.get(name)
+                if cached is None or any(old is not new for old, new in zip(cached[0], datasets)):
+                    cached = (datasets, build(*(dataset.records for dataset in datasets)))
+                    self._catalog_views[name] = cached
+        return cached[1]
+    
+    def catalog_version(self):
+        """
+        (version, last_modified) of the catalog: a digest of the doctors,
+        hospitals and cities signatures (the same in every process), and the
+        newest file modification time (None if the backend has none)
+        """
+        names = ('doctors', 'hospitals', 'cities')
+        signatures = [self.load_cached(name).signature for name in names]
+        version = hashlib.sha1(repr(signatures).encode('utf-8')).hexdigest()[:16]
+        mtimes = [mtime for mtime in map(self.backend.modified_at, names) if mtime is not None]
+        last_modified = datetime.fromtimestamp(max(mtimes) / 1e9, timezone.utc) if mtimes else None
+        return version, last_modified
+    
+    @contextmanager
+    def write_locks(self, name, *keys):
+        """
+        Hold the in-process stripe locks and the backend's cross-process locks
+        for a write touching the given keys (doctor IDs or user IDs). Stripes
+        are taken in ascending order, so writers touching two stripes cannot
+        deadlock. With no keys, the whole dataset is locked.
+        """
+        stripes = sorted({lock_stripe(key) for key in keys}) if keys else range(LOCK_STRIPES)
+        with hold_all(self.stripe_locks[name][stripe] for stripe in stripes):
+            with self.backend.write_lock(name, *keys):
+                self._local.writing = getattr(self._local, 'writing', 0) + 1
+                try:
+                    yield
+                finally:
+                    self._local.writing -= 1
+                    self.forget_snapshot(name)
+    
+    def insert_record(self, name, record):
+        """Persist a new record and index it (caller must hold write_locks)"""
+        normalize = self.normalizers.get(name)
+        if normalize:
+            record = normalize(dict(record))
+        record = self.to_record(name, record)
+        # The backend write and its fsync run outside _cache_lock, so writers
+        # holding other stripes persist in parallel
+        dataset = self.load_cached(name)
+        signatures = self.backend.insert(name, record, lambda: dataset.records + [record])
+        self.patch_cache(name, signatures, record)
+    
+    def update_record(self, name, record_id, update_data):
+        """Persist an update to one record and re-index it (caller must hold write_locks)"""
+        dataset = self.load_cached(name)
+        current = dataset.unique['id'].get(record_id)
+        if current is None:
+            return False
+        
+        record = current.to_dict()
+        record.update(update_data)
+        normalize = self.normalizers.get(name)
+        if normalize:
+            record = normalize(record)
+        record = self.to_record(name, record)
+        position = dataset.positions[record_id]
+        
+        def all_records():
+            records = list(dataset.records)
+            records[position] = record
+            return records
+        
+        signatures = self.backend.update(name, record, all_records)
+        self.patch_cache(name, signatures, record)
+        return True
+    
+    def patch_cache(self, name, signatures, record):
+        """
+        Apply our own write to the cached dataset. Another thread may have
+        reloaded it while the write ran, with or without the record, so the
+        record is upserted and the signature only follows our own writes.
+        """
+        with self._cache_lock:
+            dataset = self._cache.get(name)
+            if dataset is not None:
+                dataset.upsert(record)
+                self.accept_signature(dataset, signatures)
+    
+    def to_record(self, name, data):
+        """Convert a dict to the dataset's compact record type"""
+        record_type = self.record_types.get(name)
+        return record_type.from_dict(data) if record_type else data
+    
+    def replace_records(self, name, records):
+        """Replace every record of a dataset in one bulk write (caller must hold write_locks(name))"""
+        self.backend.replace_all(name, records)
+        self.invalidate_cache(name)
+    
+    def accept_signature(self, dataset, signatures):
+        """
+        Move the cached signature past our own write. Writes on other stripes
+        may be patched in out of order, so follow the chain of applied writes
+        as far as it goes. If another process wrote since the dataset was
+        loaded, the chain breaks there and the next read reloads.
+        """
+        before, after = signatures
+        dataset.pending[before] = after
+        while dataset.signature in dataset.pending:
+            dataset.signature = dataset.pending.pop(dataset.signature)
+    
+    def with_slot_timestamp(self, appointment):
+        """Set an appointment's slot_ts (epoch minutes) from its date and time"""
+        appointment['slot_ts'] = slot_timestamp(appointment.get('date'), appointment.get('time'))
+        return appointment
     
     # User operations
     def get_users(self):
         """Get all users"""
-        return self.read_json(self.users_file)
+        return self.read_records('users')
     
     def get_user_by_email(self, email):
         """Get user by email"""
-        users = self.get_users()
-        for user in users:
-            if user['email'] == email:
-                return user
-        return None
+        return self.find_record('users', 'email', email)
     
     def add_user(self, user_data):
         """Add a new user"""
-        users = self.get_users()
-        users.append(user_data)
-        self.write_json(self.users_file, users)
+        with self.write_locks('users', user_data['id']):
+            self.insert_record('users', user_data)
     
     # Doctor operations
     def get_doctors(self):
         """Get all doctors"""
-        return self.read_json(self.doctors_file)
+        return self.read_records('doctors')
     
     def get_doctor_by_id(self, doctor_id):
         """Get doctor by ID"""
-        doctors = self.get_doctors()
-        for doctor in doctors:
-            if doctor['id'] == doctor_id:
-                return doctor
-        return None
+        return self.find_record('doctors', 'id', doctor_id)
+    
+    def find_doctors(self, specializations=None, city_id=None, hospital_id=None):
+        """
+        Get doctors with any of the given specializations, in a city and/or
+        hospital, with hospital_name, city_id and city_name already joined
+        """
+        facets = self.catalog_view('facets', DoctorFacets)
+        return [dict(facets.doctors[doctor_id])
+                for doctor_id in facets.select(specializations, city_id, hospital_id)]
+    
+    def get_doctor_view(self, doctor_id):
+        """
+        Get (doctor, hospital, city) for a doctor in one lookup, the doctor
+        with hospital_name, city_id and city_name joined. Missing parts are None.
+        """
+        facets = self.catalog_view('facets', DoctorFacets)
+        doctor = facets.doctors.get(doctor_id)
+        if doctor is None:
+            return None, None, None
+        hospital = facets.hospitals.get(doctor.get('hospital_id'))
+        city = facets.cities.get(doctor.get('city_id'))
+        return dict(doctor), hospital.to_dict() if hospital else None, city.to_dict() if city else None
+    
+    def get_hospital_view(self, hospital_id):
+        """Get (hospital, city, joined doctors) for a hospital, or (None, None, []) if unknown"""
+        facets = self.catalog_view('facets', DoctorFacets)
+        hospital = facets.hospitals.get(hospital_id)
+        if hospital is None:
+            return None, None, []
+        city = facets.cities.get(hospital.get('city_id'))
+        doctors = [dict(facets.doctors[doctor_id]) for doctor_id in facets.select(hospital_id=hospital_id)]
+        return hospital.to_dict(), city.to_dict() if city else None, doctors
+    
+    def get_specializations(self):
+        """Get every specialization in the catalog"""
+        return [spec for spec in self.catalog_view('facets', DoctorFacets).by_specialization if spec]
     
     def search_doctors(self, query):
-        """Search doctors by name or specialization"""
-        doctors = self.get_doctors()
-        if not query:
-            return doctors
-        
-        query = query.lower()
-        filtered = []
-        for doctor in doctors:
-            if (query in doctor['name'].lower() or 
-                query in doctor['specialization'].lower()):
-                filtered.append(doctor)
-        return filtered
+        """
+        Search doctors by name, specialization, department, qualification,
+        hospital or city. Every word must match a word of the doctor, or the
+        start of one; results come most relevant first, with hospital_name, city_id
+        and city_name joined.
+        """
+        facets = self.catalog_view('facets', DoctorFacets)
+        if not query or not query.strip():
+            return [dict(doctor) for doctor in facets.doctors.values()]
+        
+        index = self.catalog_view('search', DoctorSearchIndex)
+        return [dict(facets.doctors[doctor_id]) for doctor_id in index.search(query)
+                if doctor_id in facets.doctors]
     
     def get_doctors_by_hospital(self, hospital_id):
         """Get all doctors for a specific hospital"""
-        doctors = self.get_doctors()
-        return [d for d in doctors if d.get('hospital_id') == hospital_id]
+        return self.filter_records('doctors', 'hospital_id', hospital_id)
     
     # City operations
     def get_cities(self):
         """Get all cities"""
-        return self.read_json(self.cities_file)
+        return self.read_records('cities')
     
     def get_city_by_id(self, city_id):
         """Get city by ID"""
-        cities = self.get_cities()
-        for city in cities:
-            if city['id'] == city_id:
-                return city
-        return None
+        return self.find_record('cities', 'id', city_id)
     
     # Hospital operations
     def get_hospitals(self):
         """Get all hospitals"""
-        return self.read_json(self.hospitals_file)
+        return self.read_records('hospitals')
     
     def get_hospital_by_id(self, hospital_id):
         """Get hospital by ID"""
-        hospitals = self.get_hospitals()
-        for hospital in hospitals:
-            if hospital['id'] == hospital_id:
-                return hospital
-        return None
+        return self.find_record('hospitals', 'id', hospital_id)
     
     def get_hospitals_by_city(self, city_id):
         """Get all hospitals in a specific city"""
-        hospitals = self.get_hospitals()
-        return [h for h in hospitals if h['city_id'] == city_id]
+        return self.filter_records('hospitals', 'city_id', city_id)
     
     # Appointment operations
     def get_appointments(self):
         """Get all appointments"""
-        return self.read_json(self.appointments_file)
+        return self.read_records('appointments')
     
     def get_appointments_by_user(self, user_email):
         """Get appointments for a specific user"""
-        appointments = self.get_appointments()
-        user_appointments = []
-        for appt in appointments:
-            if appt['user_email'] == user_email:
-                user_appointments.append(appt)
-        return user_appointments
+        return self.filter_records('appointments', 'user_email', user_email)
     
     def get_appointments_by_doctor(self, doctor_id):
         """Get appointments for a specific doctor"""
-        appointments = self.get_appointments()
-        doctor_appointments = []
-        for appt in appointments:
-            if appt['doctor_id'] == doctor_id:
-                doctor_appointments.append(appt)
-        return doctor_appointments
+        return self.filter_records('appointments', 'doctor_id', doctor_id)
     
-    def is_slot_booked(self, doctor_id, date, time):
-        """Check if a time slot is already booked (excluding cancelled and no_show)"""
-        appointments = self.get_appointments_by_doctor(doctor_id)
+    def is_slot_booked(self, doctor_id, date, time, exclude_id=None):
+        """
+        Check if a time slot is already booked (excluding cancelled and no_show).
+        A slot held only by the exclude_id appointment counts as free.
+        """
+        dataset = self.load_cached('appointments')
+        availability = dataset.aggregates['availability']
+        ordinal = availability.date_ordinal(date)
+        if ordinal is not None and time in availability.slot_index:
+            key = (doctor_id, ordinal, availability.slot_index[time])
+            holders = availability.holders.get(key, 0)
+            excluded = dataset.unique['id'].get(exclude_id)
+            if excluded is not None and availability.slot_key(excluded) == key:
+                holders -= 1
+            return holders > 0
+        
+        # Slots outside time_slots (or with malformed dates) are not in the bitmap
+        appointments = tuple(dataset.groups['doctor_id'].get(doctor_id, {}).values())
         for appt in appointments:
             if (appt['date'] == date and appt['time'] == time and 
-                appt['status'] in ['confirmed', 'pending_payment']):
+                appt['status'] in ['confirmed', 'pending_payment'] and
+                appt['id'] != exclude_id):
                 return True
         return False
     
+    def get_slot_availability(self, doctor_id, days=30, start=None, now=None, exclude=None):
+        """
+        Booked, past and urgent slots for a doctor over `days` days from
+        start (default today), in one pass over the availability bitmap.
+        Returns a list of (date_str, booked_mask, past_mask, urgent_mask);
+        bit i of each mask refers to time_slots[i]. The slot held by the
+        `exclude` appointment is reported as free.
+        """
+        now = now or datetime.now()
+        start = start or now.date()
+        dataset = self.load_cached('appointments')
+        availability = dataset.aggregates['availability']
+        if exclude is not None:
+            # Callers pass the dict copy; the bitmap needs the cached record
+            exclude = dataset.unique['id'].get(exclude['id'])
+        return [
+            (Date.fromordinal(ordinal).isoformat(), booked, past, urgent)
+            for ordinal, booked, past, urgent
+            in availability.days(doctor_id, start.toordinal(), days, now, exclude)
+        ]
+    
+    def get_admin_stats(self):
+        """
+        Admin dashboard statistics, read from the maintained AppointmentStats
+        and the doctors' hospital index instead of a pass over every appointment
+        """
+        doctors = self.load_cached('doctors')
+        hospitals = self.load_cached('hospitals')
+        with self._cache_lock:
+            counts = self.load_cached('appointments').aggregates['stats'].snapshot()
+        
+        # Appointments booked without a stored name fall back to the catalog
+        doctor_counts = {}
+        for (doctor_id, doctor_name), count in counts['doctors'].items():
+            if not doctor_name:
+                doctor = doctors.unique['id'].get(doctor_id)
+                doctor_name = doctor['name'] if doctor else 'Unknown Doctor'
+            doctor_counts[doctor_name] = doctor_counts.get(doctor_name, 0) + count
+        
+        hospital_counts = {}
+        for (hospital_id, hospital_name), count in counts['hospitals'].items():
+            if not hospital_name:
+                hospital = hospitals.unique['id'].get(hospital_id)
+                hospital_name = hospital['name'] if hospital else 'Unknown Hospital'
+            hospital_counts[hospital_name] = hospital_counts.get(hospital_name, 0) + count
+        
+        doctors_by_hospital = doctors.groups['hospital_id']
+        doctors_per_hospital = {
+            hospital['name']: len(doctors_by_hospital.get(hospital['id'], {}))
+            for hospital in hospitals.records
+        }
+        
+        return {
+            'total_bookings': counts['total'],
+            'confirmed_bookings': counts['statuses'].get('confirmed', 0),
+            'cancelled_bookings': counts['statuses'].get('cancelled', 0),
+            'pending_payments': counts['payment_statuses'].get('Pending', 0),
+            'successful_payments': counts['payment_statuses'].get('Success', 0),
+            'doctor_counts': doctor_counts,
+            'hospital_counts': hospital_counts,
+            'total_doctors': len(doctors.records),
+            'doctors_per_hospital': doctors_per_hospital
+        }
+    
+    def rebuild_admin_stats(self):
+        """Recount the admin statistics from the stored appointments in every worker (recovery after drift)"""
+        self.request_rebuild('appointments')
+        return self.get_admin_stats()
+    
+    def iter_appointments(self, doctor_id=None, date=None, payment_status=None, after=None):
+        """
+        Yield (cursor, appointment copy) pairs, latest slot first, filtered like
+        the admin dashboard. cursor is the appointment's (slot_ts, id) key; pass
+        one back as after to resume below it. Copies are made one at a time,
+        so callers can stream any number of appointments in constant memory.
+        """
+        dataset = self.load_cached('appointments')
+        if doctor_id:
+            # A doctor's appointments are few: order just that group
+            timeline = SlotTimeline()
+            timeline.build(tuple(dataset.groups['doctor_id'].get(doctor_id, {}).values()))
+        else:
+            timeline = dataset.aggregates['timeline']
+        
+        start, cursor = float('-inf'), (float('inf'),)
+        if date:
+            start = slot_timestamp(date, '12:00 AM')
+            if start is None:
+                return
+            cursor = (start + 1440,)
+        if after is not None and tuple(after) < cursor:
+            cursor = tuple(after)
+        
+        entries = timeline.before(cursor, start)
+        if date:
+            # Appointments whose time does not parse have no slot_ts and sit
+            # at 0, below every day: match those on their date string instead
+            entries = chain(entries, timeline.before(min(cursor, (1,)), 0))
+        
+        by_id = dataset.unique['id']
+        for entry in entries:
+            appt = by_id.get(entry[1])
+            # Skip entries a concurrent reschedule has just moved
+            if appt is None or timeline.entry(appt) != entry:
+                continue
+            if date and entry[0] == 0 and appt.date != date:
+                continue
+            if payment_status and appt.payment_status != payment_status:
+                continue
+            yield entry, appt.to_dict()
+    
+    def get_appointments_page(self, doctor_id=None, date=None, payment_status=None, after=None, limit=50):
+        """
+        One page of iter_appointments. Returns (appointments, next_cursor),
+        next_cursor being None on the last page.
+        """
+        page = []
+        last = None
+        for entry, appt in self.iter_appointments(doctor_id, date, payment_status, after):
+            if len(page) == limit:
+                return page, last
+            page.append(appt)
+            last = entry
+        return page, None
+    
+    def get_appointments_between(self, start_ts, end_ts, doctor_id=None):
+        """Appointments with start_ts <= slot_ts < end_ts (epoch minutes), in slot order"""
+        dataset = self.load_cached('appointments')
+        by_id = dataset.unique['id']
+        appointments = []
+        for _, appointment_id in dataset.aggregates['timeline'].between(start_ts, end_ts):
+            appt = by_id.get(appointment_id)
+            if appt is not None and (doctor_id is None or appt['doctor_id'] == doctor_id):
+                appointments.append(appt.to_dict())
+        return appointments
+    
+    def backfill_slot_timestamps(self):
+        """
+        Persist slot_ts on every stored appointment that lacks it, in one bulk
+        write. Loaded appointments always get it in memory; this only makes it
+        durable. Returns the number of appointments backfilled.
+        """
+        with self.write_locks('appointments'):
+            stored = self.backend.load('appointments')
+            missing = sum(1 for appt in stored if 'slot_ts' not in appt)
+            if missing:
+                self.replace_records('appointments', [self.with_slot_timestamp(appt) for appt in stored])
+            return missing
+    
+    def get_availability_summary(self, doctor_ids, days=7, start=None, now=None):
+        """
+        Next free slot and free-slot count per day for many doctors at once.
+        The past-slot masks are computed once per day and shared by every
+        doctor; each doctor then costs one bitmap lookup per day.
+        Returns {doctor_id: {'next_available': {'date', 'time'} or None,
+        'free_slots': {date_str: count}}}.
+        """
+        now = now or datetime.now()
+        start = start or now.date()
+        availability = self.load_cached('appointments').aggregates['availability']
+        
+        # Day columns shared by all doctors: (ordinal, date_str, unavailable mask)
+        calendar = [
+            (ordinal, Date.fromordinal(ordinal).isoformat(), past)
+            for ordinal, _, past, _ in availability.days(None, start.toordinal(), days, now)
+        ]
+        
+        summary = {}
+        for doctor_id in doctor_ids:
+            booked_days = availability.masks.get(doctor_id, {})
+            next_available = None
+            free_slots = {}
+            for ordinal, date_str, past in calendar:
+                free = availability.full_mask & ~(past | booked_days.get(ordinal, 0))
+                free_slots[date_str] = bin(free).count('1')
+                if free and next_available is None:
+                    # Lowest set bit is the earliest free slot of the day
+                    index = (free & -free).bit_length() - 1
+                    next_available = {'date': date_str, 'time': availability.time_slots[index]}
+            summary[doctor_id] = {'next_available': next_available, 'free_slots': free_slots}
+        return summary
+    
     def add_appointment(self, appointment_data):
         """Add a new appointment (use atomic_book_slot for thread-safe booking)"""
-        appointments = self.get_appointments()
-        appointments.append(appointment_data)
-        self.write_json(self.appointments_file, appointments)
+        with self.write_locks('appointments', appointment_data['doctor_id']):
+            self.insert_record('appointments', appointment_data)
         return True
     
     def atomic_book_slot(self, doctor_id, date, time, appointment_data):
@@ -162,43 +1125,52 @@ class DataHandler:
         Atomically book a slot - check and reserve in one operation
         Returns (success: bool, message: str, appointment_id: str or None)
         """
-        with self.lock:
-            # Re-check availability within lock
+        # Only the doctor's stripe is locked (in this process and across
+        # workers), so bookings for other doctors proceed in parallel
+        with self.write_locks('appointments', doctor_id):
+            # Re-check availability within lock (reloads if another process booked)
             if self.is_slot_booked(doctor_id, date, time):
                 return False, "This time slot was just booked by another user. Please select another slot.", None
             
-            # Check if slot is cancelled (cancelled slots show as available)
-            appointments = self.get_appointments()
-            for appt in appointments:
-                if (appt['doctor_id'] == doctor_id and 
-                    appt['date'] == date and 
-                    appt['time'] == time and 
-                    appt['status'] in ['confirmed', 'pending_payment']):
-                    return False, "This time slot is already booked. Please select another slot.", None
-            
             # Slot is available, book it
-            appointments.append(appointment_data)
-            self.write_json(self.appointments_file, appointments)
+            self.insert_record('appointments', appointment_data)
             return True, "Slot booked successfully", appointment_data['id']
     
+    def atomic_reschedule(self, appointment_id, new_date, new_time):
+        """
+        Atomically move an appointment to a new slot - validate and update in
+        one critical section with a single write
+        Returns (success: bool, message: str)
+        """
+        appointment = self.load_cached('appointments').unique['id'].get(appointment_id)
+        if appointment is None:
+            return False, "Appointment not found."
+        
+        doctor_id = appointment['doctor_id']
+        with self.write_locks('appointments', doctor_id):
+            # Re-check within lock; the appointment's own slot is released by the move
+            if self.is_slot_booked(doctor_id, new_date, new_time, exclude_id=appointment_id):
+                return False, "Selected time slot is not available. Please choose another slot."
+            
+            updated = self.update_record('appointments', appointment_id, {
+                'date': new_date,
+                'time': new_time,
+                'rescheduled_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            if not updated:
+                return False, "Failed to reschedule appointment."
+            return True, "Appointment rescheduled successfully!"
+    
     def get_appointment_by_id(self, appointment_id):
         """Get appointment by ID"""
-        appointments = self.get_appointments()
-        for appt in appointments:
-            if appt['id'] == appointment_id:
-                return appt
-        return None
+        return self.find_record('appointments', 'id', appointment_id)
     
     def update_appointment(self, appointment_id, update_data):
         """Update an appointment with new data"""
-        with self.lock:
-            appointments = self.get_appointments()
-            for i, appt in enumerate(appointments):
-                if appt['id'] == appointment_id:
-                    appointments[i].update(update_data)
-                    self.write_json(self.appointments_file, appointments)
-                    return True
-            return False
+        appointment = self.load_cached('appointments').unique['id'].get(appointment_id)
+        doctor_id = appointment['doctor_id'] if appointment else None
+        with self.write_locks('appointments', doctor_id):
+            return self.update_record('appointments', appointment_id, update_data)
     
     def cancel_appointment(self, appointment_id):
         """Cancel an appointment"""
@@ -230,20 +1202,9 @@ class DataHandler:
     
     def get_user_by_id(self, user_id):
         """Get user by ID"""
-        users = self.get_users()
-        for user in users:
-            if user['id'] == user_id:
-                return user
-        return None
+        return self.find_record('users', 'id', user_id)
     
     def update_user(self, user_id, update_data):
         """Update user information"""
-        with self.lock:
-            users = self.get_users()
-            for i, user in enumerate(users):
-                if user['id'] == user_id:
-                    users[i].update(update_data)
-                    self.write_json(self.users_file, users)
-                    return True
-            return False
-
+        with self.write_locks('users', user_id):
+            return self.update_record('users', user_id, update_data)
@@ -0,0 +1,128 @@
+"""
+Bulk import of the doctor catalog (cities, hospitals and doctors) from CSV or NDJSON.
+
+Sources are read one row at a time, validated as a batch (required fields,
+duplicate IDs, city_id -> cities, hospital_id -> hospitals) and merged
+into the existing catalog by ID. Nothing is written unless every row is
+valid, and each dataset file is then swapped in with an atomic rename.
+"""
+import csv
+import json
+import os
+from contextlib import ExitStack
+
+# Referenced datasets come first, so a reader never sees a dangling reference
+CATALOG = ('cities', 'hospitals', 'doctors')
+
+REQUIRED_FIELDS = {
+    'cities': ('id', 'name'),
+    'hospitals': ('id', 'name', 'city_id'),
+    'doctors': ('id', 'name', 'specialization', 'hospital_id'),
+}
+
+# dataset -> (field, referenced dataset)
+FOREIGN_KEYS = {
+    'hospitals': ('city_id', 'cities'),
+    'doctors': ('hospital_id', 'hospitals'),
+}
+
+# CSV cells are strings; convert the fields the catalog stores as other types
+CSV_CONVERTERS = {
+    'doctors': {'fees': int},
+    'hospitals': {'specialties': lambda value: [s.strip() for s in value.split(';') if s.strip()]},
+}
+
+def source_format(filename):
+    """'csv' or 'ndjson' from a file name's extension, or None if unsupported"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return None
+
+def read_rows(f, fmt, dataset):
+    """Yield (line number, record, error) for each row of an open text file"""
+    if fmt == 'csv':
+        converters = CSV_CONVERTERS.get(dataset, {})
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            record = {field: value for field, value in row.items() if field and value not in (None, '')}
+            try:
+                for field, convert in converters.items():
+                    if field in record:
+                        record[field] = convert(record[field])
+            except ValueError as e:
+                yield line_no, None, f'{field}: {e}'
+                continue
+            yield line_no, record, None
+    else:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f'invalid JSON ({e.msg})'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, 'expected a JSON object'
+                continue
+            yield line_no, record, None
+
+def import_catalog(data_handler, sources):
+    """
+    Import catalog records. sources maps dataset name -> (open text file, format).
+    Returns (imported, errors): imported maps dataset -> rows imported, and
+    is empty when there are errors, in which case nothing was written.
+    """
+    errors = []
+    incoming = {}
+    line_numbers = {}
+    for dataset in CATALOG:
+        if dataset not in sources:
+            continue
+        f, fmt = sources[dataset]
+        records = incoming[dataset] = {}
+        lines = line_numbers[dataset] = {}
+        for line_no, record, error in read_rows(f, fmt, dataset):
+            where = f'{dataset} line {line_no}'
+            if error:
+                errors.append(f'{where}: {error}')
+                continue
+            missing = [field for field in REQUIRED_FIELDS[dataset] if not record.get(field)]
+            if missing:
+                errors.append(f"{where}: missing {', '.join(missing)}")
+                continue
+            if record['id'] in records:
+                errors.append(f"{where}: duplicate id {record['id']}")
+                continue
+            records[record['id']] = record
+            lines[record['id']] = line_no
+    
+    # Lock every dataset being written, in catalog order, for the whole merge
+    with ExitStack() as stack:
+        for dataset in incoming:
+            stack.enter_context(data_handler.write_locks(dataset))
+        
+        existing = {dataset: data_handler.read_records(dataset) for dataset in CATALOG}
+        
+        # Foreign keys may point at existing records or at ones in this import
+        for dataset, (field, target) in FOREIGN_KEYS.items():
+            if dataset not in incoming:
+                continue
+            known = {record['id'] for record in existing[target]} | set(incoming.get(target, ()))
+            for record_id, record in incoming[dataset].items():
+                if record[field] not in known:
+                    where = f'{dataset} line {line_numbers[dataset][record_id]}'
+                    errors.append(f'{where}: unknown {field} {record[field]}')
+        
+        if errors:
+            return {}, errors
+        
+        for dataset, records in incoming.items():
+            # Replace existing records in place, append new ones
+            merged = [records.pop(record['id'], record) for record in existing[dataset]]
+            merged.extend(records.values())
+            data_handler.replace_records(dataset, merged)
+    
+    return {dataset: len(line_numbers[dataset]) for dataset in incoming}, []
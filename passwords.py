@@ -0,0 +1,76 @@
+"""
+Password hashing off the request threads.
+
+scrypt costs tens of milliseconds of CPU per hash, so hashing and checking
+run in a small process pool. Only max_pending calls may be queued on it;
+past that, callers get PasswordHasherBusy at once instead of piling up,
+and the login and register routes answer 503 with Retry-After.
+
+The pool starts its workers with forkserver (spawn where that is missing),
+which imports the main module: scripts that hash passwords need an
+`if __name__ == '__main__':` guard, as app.py has.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Parameters for new hashes; stored hashes made with others are upgraded at login
+PASSWORD_METHOD = 'scrypt:32768:8:1'
+
+# Pool workers are not forked from the threaded server, whose locks (held by
+# other request threads at fork time) would stay locked in the children
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+class PasswordHasher:
+    """Bounded process pool for generate_password_hash and check_password_hash"""
+    
+    def __init__(self, workers=None, max_pending=None, method=PASSWORD_METHOD):
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_pending = max_pending or self.workers * 4
+        self.method = method
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pool_pid = None
+    
+    def get_pool(self):
+        """The process pool, started on first use and again after a fork"""
+        with self.lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context(START_METHOD))
+                self.pool_pid = os.getpid()
+            return self.pool
+    
+    def run(self, func, *args):
+        """Run func in the pool and wait for it, or raise PasswordHasherBusy"""
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            try:
+                return self.get_pool().submit(func, *args).result()
+            except BrokenProcessPool:
+                # A worker died: start a fresh pool and try once more
+                with self.lock:
+                    self.pool = None
+                return self.get_pool().submit(func, *args).result()
+        finally:
+            self.slots.release()
+    
+    def hash(self, password):
+        """Hash a new password"""
+        return self.run(generate_password_hash, password, self.method)
+    
+    def verify(self, pwhash, password):
+        """Check a password against its stored hash"""
+        return self.run(check_password_hash, pwhash, password)
+    
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash was made with other parameters than ours"""
+        return pwhash.split('$', 1)[0] != self.method
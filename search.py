@@ -0,0 +1,264 @@
+"""
+Inverted index for doctor search.
+
+Doctors are tokenized over their own fields plus their hospital's and
+city's names. A query matches doctors that have every query word, either
+exactly or as a prefix ('card' finds 'Cardiologist'), ranked by how
+strongly and in which fields the words matched.
+"""
+import re
+from bisect import bisect_left
+
+# Relevance of a word by the field it appears in
+FIELD_WEIGHTS = {
+    'name': 4.0,
+    'specialization': 3.0,
+    'department': 2.0,
+    'hospital_name': 1.5,
+    'city_name': 1.5,
+    'qualification': 1.0,
+}
+
+# A prefix match counts for less than the whole word
+PREFIX_WEIGHT = 0.5
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Lowercase words of a string ('Dr. K. Rao, MBBS' -> ['dr', 'k', 'rao', 'mbbs'])"""
+    return TOKEN_PATTERN.findall(str(text).lower()) if text else []
+
+class DoctorSearchIndex:
+    """Token -> {doctor ID: weight} postings over a catalog snapshot"""
+    
+    def __init__(self, doctors, hospitals, cities):
+        hospitals_by_id = {hospital['id']: hospital for hospital in hospitals}
+        cities_by_id = {city['id']: city for city in cities}
+        
+        # Catalog order breaks ties between equally relevant doctors
+        self.order = {}
+        self.postings = {}
+        for position, doctor in enumerate(doctors):
+            self.order[doctor['id']] = position
+            hospital = hospitals_by_id.get(doctor.get('hospital_id'), {})
+            city = cities_by_id.get(hospital.get('city_id'), {})
+            fields = dict(doctor, hospital_name=hospital.get('name'), city_name=city.get('name'))
+            
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(fields.get(field)):
+                    postings = self.postings.setdefault(token, {})
+                    # A word counts once per doctor, in its strongest field
+                    if postings.get(doctor['id'], 0) < weight:
+                        postings[doctor['id']] = weight
+        
+        # Sorted vocabulary for prefix lookups
+        self.tokens = sorted(self.postings)
+    
+    def expand(self, prefix):
+        """Yield (token, weight multiplier) for every indexed token starting with prefix"""
+        index = bisect_left(self.tokens, prefix)
+        while index < len(self.tokens) and self.tokens[index].startswith(prefix):
+            token = self.tokens[index]
+            yield token, 1.0 if token == prefix else PREFIX_WEIGHT
+            index += 1
+    
+    def search(self, query):
+        """Doctor IDs matching every word of query, most relevant first"""
+        scores = None
+        for word in dict.fromkeys(tokenize(query)):
+            word_scores = {}
+            for token, multiplier in self.expand(word):
+                for doctor_id, weight in self.postings[token].items():
+                    score = weight * multiplier
+                    if word_scores.get(doctor_id, 0) < score:
+                        word_scores[doctor_id] = score
+            
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {doctor_id: score + word_scores[doctor_id]
+                          for doctor_id, score in scores.items() if doctor_id in word_scores}
+            if not scores:
+                return []
+        
+        if scores is None:
+            return []
+        return sorted(scores, key=lambda doctor_id: (-scores[doctor_id], self.order[doctor_id]))
+
+# Suggestion types, in the order they are listed for equally good matches
+SUGGESTION_TYPES = ('specialization', 'symptom', 'doctor')
+
+class Autocompleter:
+    """
+    Typeahead over doctor names, specializations and symptom keywords.
+    Every word-suffix of each label ('rajesh kumar', 'kumar') is kept in one
+    sorted array, so a prefix lookup is a bisect plus a short scan.
+    """
+    
+    # Matches examined per lookup before ranking; bounds work on short prefixes
+    SCAN_LIMIT = 200
+    
+    def __init__(self, doctors, symptoms):
+        suggestions = [{'type': 'doctor', 'label': doctor['name'], 'id': doctor['id']} for doctor in doctors]
+        specializations = dict.fromkeys(doctor['specialization'] for doctor in doctors if doctor.get('specialization'))
+        suggestions.extend({'type': 'specialization', 'label': label} for label in specializations)
+        suggestions.extend({'type': 'symptom', 'label': label} for label in symptoms)
+        
+        entries = []
+        for position, suggestion in enumerate(suggestions):
+            words = tokenize(suggestion['label'])
+            for start in range(len(words)):
+                # start == 0 marks a match from the beginning of the label
+                entries.append((' '.join(words[start:]), start, position))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+        self.suggestions = suggestions
+    
+    def complete(self, query, limit=8, types=SUGGESTION_TYPES):
+        """Top suggestions whose label, or a word in it, starts with query"""
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+        
+        matches = {}
+        index = bisect_left(self.keys, prefix)
+        end = min(len(self.keys), index + self.SCAN_LIMIT)
+        while index < end and self.keys[index].startswith(prefix):
+            _, start, position = self.entries[index]
+            suggestion = self.suggestions[position]
+            if suggestion['type'] in types:
+                matches[position] = min(start, matches.get(position, start))
+            index += 1
+        
+        # Label prefixes first, then by type, then alphabetically
+        ranked = sorted(matches, key=lambda position: (
+            matches[position] > 0,
+            SUGGESTION_TYPES.index(self.suggestions[position]['type']),
+            self.suggestions[position]['label'].lower(),
+        ))
+        return [dict(self.suggestions[position]) for position in ranked[:limit]]
+
+class SymptomMatcher:
+    """
+    Finds known symptom phrases in free text with one pass over its words.
+    Compiled once from {phrase: [values]}, the values being specializations
+    or causes in order of relevance. 'fever and back pain' finds both
+    'fever' and 'back pain'; a fragment such as 'pain' finds every phrase
+    containing it. A word may extend a phrase word with any ending, so
+    inflections match too:
+    
+    >>> matcher = SymptomMatcher({'cough': ['GP'], 'fever': ['GP', 'Pediatrician'], 'back pain': ['Ortho']})
+    >>> matcher.find('i am coughing'), matcher.find('coughing badly'), matcher.find('feverish')
+    (['cough'], ['cough'], ['fever'])
+    >>> matcher.find('headaches and back pains since monday')
+    ['back pain']
+    >>> matcher.find('pain')
+    ['back pain']
+    """
+    
+    def __init__(self, phrases):
+        self.values = {}
+        # First word -> phrase word tuples starting with it
+        self.by_first = {}
+        fragments = []
+        for phrase, values in phrases.items():
+            words = tuple(tokenize(phrase))
+            if not words:
+                continue
+            self.values[phrase] = list(values)
+            self.by_first.setdefault(words[0], []).append((words, phrase))
+            for start in range(len(words)):
+                fragments.append((' '.join(words[start:]), phrase))
+        fragments.sort()
+        self.fragment_keys = [fragment[0] for fragment in fragments]
+        self.fragments = fragments
+    
+    def word_matches(self, word, phrase_word):
+        return word.startswith(phrase_word)
+    
+    def find(self, text):
+        """Known phrases in text, in order of appearance, or else the phrases containing text"""
+        words = tokenize(text)
+        found = {}
+        for position, word in enumerate(words):
+            # Every prefix of the word may be a phrase's first word
+            for end in range(len(word), 0, -1):
+                for phrase_words, phrase in self.by_first.get(word[:end], ()):
+                    candidate = words[position:position + len(phrase_words)]
+                    if len(candidate) == len(phrase_words) and all(map(self.word_matches, candidate, phrase_words)):
+                        found[phrase] = None
+        
+        if not found and words:
+            prefix = ' '.join(words)
+            index = bisect_left(self.fragment_keys, prefix)
+            while index < len(self.fragment_keys) and self.fragment_keys[index].startswith(prefix):
+                found[self.fragments[index][1]] = None
+                index += 1
+        return list(found)
+    
+    def values_for(self, text):
+        """Values of every phrase found in text, without repeats"""
+        return list(dict.fromkeys(value for phrase in self.find(text) for value in self.values[phrase]))
+    
+    def score(self, text):
+        """
+        [(value, score)] for the phrases found in text, best first. Each phrase
+        adds 1 to its first value, 1/2 to its second, and so on.
+        """
+        scores = {}
+        for phrase in self.find(text):
+            for rank, value in enumerate(self.values[phrase]):
+                scores[value] = scores.get(value, 0) + 1 / (rank + 1)
+        return sorted(scores.items(), key=lambda item: -item[1])
+
+class DoctorFacets:
+    """
+    Read-optimized doctor view: each doctor joined with their hospital and
+    city names, the hospital and city records by ID, and sets of doctor IDs
+    per specialization, city and hospital, so a filtered lookup is a set
+    intersection instead of a pass over the catalog
+    """
+    
+    def __init__(self, doctors, hospitals, cities):
+        hospitals_by_id = self.hospitals = {hospital['id']: hospital for hospital in hospitals}
+        cities_by_id = self.cities = {city['id']: city for city in cities}
+        
+        self.doctors = {}
+        self.order = {}
+        self.by_specialization = {}
+        self.by_city = {}
+        self.by_hospital = {}
+        for position, doctor in enumerate(doctors):
+            joined = dict(doctor)
+            hospital = hospitals_by_id.get(doctor.get('hospital_id'))
+            city = cities_by_id.get(hospital.get('city_id')) if hospital else None
+            if hospital:
+                joined['hospital_name'] = hospital['name']
+            if city:
+                joined['city_id'] = city['id']
+                joined['city_name'] = city['name']
+            
+            self.doctors[doctor['id']] = joined
+            self.order[doctor['id']] = position
+            self.by_specialization.setdefault(doctor.get('specialization'), set()).add(doctor['id'])
+            self.by_hospital.setdefault(doctor.get('hospital_id'), set()).add(doctor['id'])
+            if city:
+                self.by_city.setdefault(city['id'], set()).add(doctor['id'])
+    
+    def select(self, specializations=None, city_id=None, hospital_id=None):
+        """IDs of doctors matching every given facet, in catalog order"""
+        facets = []
+        if specializations is not None:
+            facets.append(set().union(*(self.by_specialization.get(spec, ()) for spec in specializations)))
+        if city_id:
+            facets.append(self.by_city.get(city_id, set()))
+        if hospital_id:
+            facets.append(self.by_hospital.get(hospital_id, set()))
+        
+        if not facets:
+            return list(self.doctors)
+        # Intersect starting from the smallest set
+        facets.sort(key=len)
+        matched = facets[0].intersection(*facets[1:])
+        return sorted(matched, key=self.order.__getitem__)
@@ -19,6 +19,7 @@ function initializeApp() {
     initNavbar();
     initCards();
     initLoadingStates();
+    initAutocomplete();
 }
 
 // ========================================
@@ -529,3 +530,41 @@ window.addEventListener('beforeunload', function() {
 // Log app initialization
 console.log('%c HealthCare Plus ', 'background: #1A73E8; color: white; padding: 8px 16px; border-radius: 4px; font-weight: bold;');
 console.log('%c Modern UI initialized successfully! ', 'color: #34A853; font-weight: bold;');
+
+// ========================================
+// Autocomplete
+// ========================================
+function initAutocomplete() {
+    // Inputs opt in with data-autocomplete="doctor,specialization,symptom"
+    document.querySelectorAll('input[data-autocomplete]').forEach(function(input) {
+        const list = document.createElement('datalist');
+        list.id = input.id + 'Suggestions';
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        let timer = null;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (!query) {
+                list.innerHTML = '';
+                return;
+            }
+            timer = setTimeout(function() {
+                const params = new URLSearchParams({ q: query, types: input.dataset.autocomplete });
+                fetch('/api/autocomplete?' + params)
+                    .then(response => response.json())
+                    .then(function(suggestions) {
+                        list.innerHTML = '';
+                        suggestions.forEach(function(suggestion) {
+                            const option = document.createElement('option');
+                            option.value = suggestion.label;
+                            list.appendChild(option);
+                        });
+                    })
+                    .catch(() => {});
+            }, 150);
+        });
+    });
+}
@@ -0,0 +1,750 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks, in-process locks still apply
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib json module is used instead
+    orjson = None
+
+# Number of lock stripes per dataset for backends that write single records
+LOCK_STRIPES = 64
+
+def json_default(obj):
+    """Serialize the compact record objects DataHandler caches (anything with to_dict)"""
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+    return to_dict()
+
+class JSONCodec:
+    """
+    Encodes and parses the JSON the backends store, with the stdlib json module.
+    Output is compact unless pretty is set, in which case files are indented
+    for reading by hand (journal lines and SQLite rows are always compact).
+    """
+    
+    name = 'json'
+    
+    def __init__(self, pretty=False):
+        self.pretty = pretty
+    
+    def loads(self, data):
+        """Parse a JSON document from bytes or str"""
+        return json.loads(data)
+    
+    def dumps(self, obj):
+        """Encode a document as UTF-8 bytes, indented if pretty"""
+        if self.pretty:
+            return json.dumps(obj, indent=4, default=json_default).encode('utf-8')
+        return self.dumps_line(obj)
+    
+    def dumps_line(self, obj):
+        """Encode a document as compact UTF-8 bytes on a single line"""
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=json_default).encode('utf-8')
+
+class OrjsonCodec(JSONCodec):
+    """The same format through orjson, several times faster both ways"""
+    
+    name = 'orjson'
+    
+    def loads(self, data):
+        return orjson.loads(data)
+    
+    def dumps(self, obj):
+        # orjson only indents by two spaces
+        option = orjson.OPT_INDENT_2 if self.pretty else 0
+        return orjson.dumps(obj, default=json_default, option=option)
+    
+    def dumps_line(self, obj):
+        return orjson.dumps(obj, default=json_default)
+
+CODECS = {
+    'json': JSONCodec,
+    'orjson': OrjsonCodec,
+}
+
+def get_codec(name='auto', pretty=False):
+    """Build a codec from its configuration name ('auto', 'orjson' or 'json'); 'auto' uses orjson if installed"""
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec: {name}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("The orjson codec needs the orjson package (pip install orjson)")
+    return CODECS[name](pretty)
+
+DEFAULT_CODEC = get_codec()
+
+def read_json_file(filename, codec=None):
+    """
+    Read a list of records from a JSON file ([] if it does not exist).
+    Files are only ever replaced whole, so one that does not parse is
+    damaged: raise rather than pass it off as an empty dataset.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    try:
+        return (codec or DEFAULT_CODEC).loads(data)
+    except ValueError as e:  # Malformed JSON (orjson's error subclasses json's) or bad UTF-8
+        raise ValueError(f'{filename} is not valid JSON ({e})') from e
+
+def fsync_dir(path):
+    """fsync a directory, making renames and new files in it durable (not supported on Windows)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_json_file(filename, data, codec=None):
+    """
+    Write a list of records atomically: to a temp file that is fsync'd and
+    renamed over filename, then fsync the directory. Readers (which take no
+    lock) see the old file or the new one, never a truncated or partial one,
+    and a crash leaves one of the two on disk. The caller holds the
+    dataset's write_lock, so the temp file is never shared.
+    """
+    temp_path = f'{filename}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write((codec or DEFAULT_CODEC).dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_dir(os.path.dirname(os.path.abspath(filename)))
+
+def lock_stripe(key):
+    """Map a key (doctor ID, user ID) to a lock stripe, stable across processes"""
+    return zlib.crc32(str(key).encode('utf-8')) % LOCK_STRIPES
+
+class FileLock:
+    """
+    Cross-process exclusive lock, held with flock() on a lock file.
+    Every acquire opens its own descriptor, so the lock also excludes other
+    threads of the same process. Without fcntl it is a no-op.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+    
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.fd is not None:
+            # Closing the descriptor releases the lock
+            os.close(self.fd)
+            self.fd = None
+
+@contextmanager
+def hold_all(locks):
+    """Acquire an iterable of locks in order and release them together"""
+    with ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+class StorageBackend:
+    """
+    Persistence interface behind DataHandler.
+    Datasets are addressed by name ('users', 'doctors', 'hospitals',
+    'cities', 'appointments') and stored as lists of dicts with an 'id' key.
+    """
+    
+    def signature(self, dataset):
+        """Return a token that changes whenever the dataset changes on disk"""
+        raise NotImplementedError
+    
+    def modified_at(self, dataset):
+        """Return the dataset's last modification time in ns since the epoch, or None if unknown"""
+        return None
+    
+    def load(self, dataset):
+        """Return every record of a dataset, in insertion order"""
+        raise NotImplementedError
+    
+    def changes(self, dataset, since):
+        """
+        Return the records written after signature `since` (one this backend
+        returned), oldest first, so a cache can catch up without a full
+        load. None means the backend cannot tell and the caller must load().
+        """
+        return None
+    
+    def insert(self, dataset, record, all_records):
+        """
+        Persist a new record. all_records() returns the full list after the
+        insert, built only by backends that rewrite the whole dataset.
+        Returns the (before, after) signatures around this write, so the
+        caller can tell whether anyone else wrote in between.
+        """
+        raise NotImplementedError
+    
+    def update(self, dataset, record, all_records):
+        """Persist a new version of an existing record (arguments and result as for insert)"""
+        raise NotImplementedError
+    
+    def replace_all(self, dataset, records):
+        """
+        Replace every record of a dataset in one bulk write (the caller holds
+        the whole-dataset write_lock). Returns (before, after) as for insert.
+        """
+        raise NotImplementedError
+    
+    def lock_path(self, dataset, stripe=None):
+        """Path of the lock file for a dataset, or for one stripe of it"""
+        lock_dir = os.path.join(self.data_dir, '.locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        name = dataset if stripe is None else f'{dataset}.{stripe}'
+        return os.path.join(lock_dir, f'{name}.lock')
+    
+    def write_lock(self, dataset, *keys):
+        """
+        Cross-process lock to hold around a read-check-write on a dataset.
+        The default locks the whole dataset; backends that persist single
+        records stripe it by key (doctor ID or user ID) instead.
+        """
+        return FileLock(self.lock_path(dataset))
+    
+    def striped_lock(self, dataset, keys):
+        """
+        Lock the stripes of the given keys (every stripe if there are none).
+        Stripes are taken in ascending order, so writers that touch
+        overlapping stripes cannot deadlock.
+        """
+        stripes = sorted({lock_stripe(key) for key in keys}) if keys else range(LOCK_STRIPES)
+        return hold_all(FileLock(self.lock_path(dataset, stripe)) for stripe in stripes)
+
+class JSONBackend(StorageBackend):
+    """One JSON file per dataset in data_dir (the original format)"""
+    
+    def __init__(self, data_dir='data', codec=None):
+        self.data_dir = data_dir
+        self.codec = codec or DEFAULT_CODEC
+    
+    def path(self, dataset):
+        """Path of the JSON file holding a dataset"""
+        return os.path.join(self.data_dir, f'{dataset}.json')
+    
+    def signature(self, dataset):
+        """Return (inode, mtime_ns, size) of the dataset file, or None if it does not exist"""
+        try:
+            stat = os.stat(self.path(dataset))
+        except FileNotFoundError:
+            return None
+        # Every write renames a new file into place, so the inode alone marks a change
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def modified_at(self, dataset):
+        """Return the dataset file's mtime_ns, or None if it does not exist"""
+        try:
+            return os.stat(self.path(dataset)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def load(self, dataset):
+        """Parse the dataset file"""
+        return read_json_file(self.path(dataset), self.codec)
+    
+    def insert(self, dataset, record, all_records):
+        """Rewrite the dataset file with the new record appended"""
+        return self.rewrite(dataset, all_records())
+    
+    def update(self, dataset, record, all_records):
+        """Rewrite the dataset file with the updated record"""
+        return self.rewrite(dataset, all_records())
+    
+    def replace_all(self, dataset, records):
+        """Swap in a new dataset file"""
+        return self.rewrite(dataset, records)
+    
+    def rewrite(self, dataset, records):
+        """Swap in a new dataset file (the caller holds its write_lock)"""
+        before = self.signature(dataset)
+        write_json_file(self.path(dataset), records, self.codec)
+        return before, self.signature(dataset)
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite (WAL mode) storage for users and appointments.
+    Each booking or update is a single indexed row write instead of a
+    whole-file rewrite. The read-only catalog (doctors, hospitals, cities)
+    stays in its JSON files.
+    """
+    
+    # Indexed columns per table; the full record is kept as JSON in 'data'
+    TABLES = {
+        'users': ('email',),
+        'appointments': ('doctor_id', 'date', 'time', 'user_email', 'status', 'payment_status'),
+    }
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            email TEXT,
+            data TEXT NOT NULL,
+            version INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+        
+        CREATE TABLE IF NOT EXISTS appointments (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            doctor_id TEXT,
+            date TEXT,
+            time TEXT,
+            user_email TEXT,
+            status TEXT,
+            payment_status TEXT,
+            data TEXT NOT NULL,
+            version INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments (doctor_id, date, time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments (user_email);
+        CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments (status);
+        
+        CREATE TABLE IF NOT EXISTS versions (
+            dataset TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            reset INTEGER NOT NULL DEFAULT 0
+        );
+    """
+    
+    # Columns added since the first schema: table -> (column, definition)
+    MIGRATIONS = (
+        ('users', 'version', 'INTEGER'),
+        ('appointments', 'version', 'INTEGER'),
+        ('versions', 'reset', 'INTEGER NOT NULL DEFAULT 0'),
+    )
+    
+    def __init__(self, data_dir='data', db_path=None, codec=None):
+        self.data_dir = data_dir
+        self.db_path = db_path or os.path.join(data_dir, 'appointments.db')
+        self.codec = codec or DEFAULT_CODEC
+        self.catalog = JSONBackend(data_dir, self.codec)
+        
+        # One shared connection; sqlite3 connections are not thread-safe on their own
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        self.migrate()
+        self.conn.executemany('INSERT OR IGNORE INTO versions (dataset) VALUES (?)',
+                              [(dataset,) for dataset in self.TABLES])
+        self.conn.commit()
+    
+    def migrate(self):
+        """Add columns missing from a database created by an older schema"""
+        for table, column, definition in self.MIGRATIONS:
+            columns = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        for table in self.TABLES:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_version ON {table} (version)')
+    
+    def signature(self, dataset):
+        """
+        Return the table's version. Every write bumps it in its own transaction,
+        so unlike PRAGMA data_version it also moves on this connection's commits
+        """
+        if dataset not in self.TABLES:
+            return self.catalog.signature(dataset)
+        with self.lock:
+            return self.conn.execute('SELECT version FROM versions WHERE dataset = ?', (dataset,)).fetchone()[0]
+    
+    def modified_at(self, dataset):
+        """Return the catalog file's mtime_ns (None for tables)"""
+        if dataset not in self.TABLES:
+            return self.catalog.modified_at(dataset)
+        return None
+    
+    def load(self, dataset):
+        """Read every row of a table in insertion order"""
+        if dataset not in self.TABLES:
+            return self.catalog.load(dataset)
+        with self.lock:
+            rows = self.conn.execute(f'SELECT data FROM {dataset} ORDER BY seq').fetchall()
+        return [self.codec.loads(row[0]) for row in rows]
+    
+    def changes(self, dataset, since):
+        """
+        Read the rows stamped with a version after `since`. None if the table
+        was replaced since then (replace_all deletes rows, which leave no stamp)
+        """
+        if dataset not in self.TABLES:
+            return self.catalog.changes(dataset, since)
+        if since is None:
+            return None
+        with self.lock, self.conn:
+            # One read transaction, so the reset check and the rows agree
+            self.conn.execute('BEGIN')
+            reset = self.conn.execute('SELECT reset FROM versions WHERE dataset = ?', (dataset,)).fetchone()[0]
+            if reset > since:
+                return None
+            rows = self.conn.execute(f'SELECT data FROM {dataset} WHERE version > ? ORDER BY version, seq',
+                                     (since,)).fetchall()
+        return [self.codec.loads(row[0]) for row in rows]
+    
+    def write_lock(self, dataset, *keys):
+        """Rows are written one at a time, so lock only the keys' stripes"""
+        if dataset not in self.TABLES:
+            return super().write_lock(dataset)
+        return self.striped_lock(dataset, keys)
+    
+    def _row(self, dataset, record):
+        columns = self.TABLES[dataset]
+        return (record['id'],) + tuple(record.get(column) for column in columns) + (self.codec.dumps_line(record).decode('utf-8'),)
+    
+    def insert(self, dataset, record, all_records):
+        """Insert one row"""
+        if dataset not in self.TABLES:
+            return self.catalog.insert(dataset, record, all_records)
+        return self.insert_many(dataset, [record])
+    
+    def insert_many(self, dataset, records):
+        """Insert several rows in one transaction"""
+        columns = ('id',) + self.TABLES[dataset] + ('data', 'version')
+        placeholders = ', '.join('?' for _ in columns)
+        with self.lock:
+            with self.conn:
+                signatures = self.bump_version(dataset)
+                self.conn.executemany(
+                    f'INSERT INTO {dataset} ({", ".join(columns)}) VALUES ({placeholders})',
+                    [self._row(dataset, record) + signatures[1:] for record in records]
+                )
+        return signatures
+    
+    def bump_version(self, dataset):
+        """
+        Advance a table's version as the first statement of a write transaction
+        (taking the database write lock). Returns (before, after); the rows
+        written are stamped with after.
+        """
+        self.conn.execute('UPDATE versions SET version = version + 1 WHERE dataset = ?', (dataset,))
+        after = self.conn.execute('SELECT version FROM versions WHERE dataset = ?', (dataset,)).fetchone()[0]
+        return after - 1, after
+    
+    def update(self, dataset, record, all_records):
+        """Update one row in place"""
+        if dataset not in self.TABLES:
+            return self.catalog.update(dataset, record, all_records)
+        columns = self.TABLES[dataset] + ('data', 'version')
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        row = self._row(dataset, record)
+        with self.lock:
+            with self.conn:
+                signatures = self.bump_version(dataset)
+                self.conn.execute(f'UPDATE {dataset} SET {assignments} WHERE id = ?',
+                                  row[1:] + signatures[1:] + row[:1])
+        return signatures
+    
+    def replace_all(self, dataset, records):
+        """Delete and reinsert every row in one transaction"""
+        if dataset not in self.TABLES:
+            return self.catalog.replace_all(dataset, records)
+        columns = ('id',) + self.TABLES[dataset] + ('data', 'version')
+        placeholders = ', '.join('?' for _ in columns)
+        with self.lock:
+            with self.conn:
+                signatures = self.bump_version(dataset)
+                self.conn.execute('UPDATE versions SET reset = version WHERE dataset = ?', (dataset,))
+                self.conn.execute(f'DELETE FROM {dataset}')
+                self.conn.executemany(
+                    f'INSERT INTO {dataset} ({", ".join(columns)}) VALUES ({placeholders})',
+                    [self._row(dataset, record) + signatures[1:] for record in records]
+                )
+        return signatures
+
+class JournalBackend(JSONBackend):
+    """
+    Appointments as a snapshot file plus an append-only journal.
+    Each create or update appends one fsync'd line to appointments.journal
+    instead of rewriting appointments.json. Startup replays the journal on
+    top of the snapshot, other workers replay just the lines appended since
+    their last read, and a background thread folds the journal back into
+    the snapshot once it grows past compact_bytes.
+    
+    Every event carries the full record, so replay is idempotent: a crash
+    after the snapshot swap but before the journal is cleared just replays
+    events that are already in the snapshot.
+    """
+    
+    JOURNALED = ('appointments',)
+    
+    def __init__(self, data_dir='data', compact_bytes=1024 * 1024, codec=None):
+        super().__init__(data_dir, codec)
+        self.compact_bytes = compact_bytes
+        self.lock = threading.Lock()
+        self.compacting = False
+    
+    def journal_path(self, dataset):
+        """Path of the journal file for a dataset"""
+        return os.path.join(self.data_dir, f'{dataset}.journal')
+    
+    def signature(self, dataset):
+        """Combine the snapshot and journal file signatures"""
+        snapshot = super().signature(dataset)
+        if dataset not in self.JOURNALED:
+            return snapshot
+        try:
+            stat = os.stat(self.journal_path(dataset))
+        except FileNotFoundError:
+            return (snapshot, None)
+        return (snapshot, (stat.st_mtime_ns, stat.st_size))
+    
+    def modified_at(self, dataset):
+        """Return the newer of the snapshot and journal mtimes"""
+        mtime = super().modified_at(dataset)
+        if dataset not in self.JOURNALED:
+            return mtime
+        try:
+            journal_mtime = os.stat(self.journal_path(dataset)).st_mtime_ns
+        except FileNotFoundError:
+            return mtime
+        return max(mtime or 0, journal_mtime)
+    
+    def load(self, dataset):
+        """Read the snapshot and replay the journal over it"""
+        if dataset not in self.JOURNALED:
+            return super().load(dataset)
+        
+        while True:
+            snapshot = super().signature(dataset)
+            records = {record['id']: record for record in super().load(dataset)}
+            for event in self.read_journal(dataset):
+                record = event['record']
+                records[record['id']] = record
+            # A compaction that swapped the snapshot and cleared the journal
+            # between the two reads could have dropped events: read again
+            if super().signature(dataset) == snapshot:
+                return list(records.values())
+    
+    def write_lock(self, dataset, *keys):
+        """Appends are single records, so lock only the keys' stripes"""
+        if dataset not in self.JOURNALED:
+            return super().write_lock(dataset)
+        return self.striped_lock(dataset, keys)
+    
+    def changes(self, dataset, since):
+        """
+        Replay the journal from the size recorded in `since`. None once a
+        compaction has swapped the snapshot, or if that size does not end
+        a line
+        """
+        if dataset not in self.JOURNALED:
+            return super().changes(dataset, since)
+        if since is None:
+            return None
+        snapshot, journal = since
+        offset = journal[1] if journal else 0
+        if super().signature(dataset) != snapshot or not self.ends_line(dataset, offset):
+            return None
+        records = [event['record'] for event in self.read_journal(dataset, offset)]
+        # As in load: a compaction during the read could have dropped events
+        if super().signature(dataset) != snapshot:
+            return None
+        return records
+    
+    def ends_line(self, dataset, offset):
+        """Whether offset is the start of the journal or just past a newline in it"""
+        if offset == 0:
+            return True
+        try:
+            with open(self.journal_path(dataset), 'rb') as f:
+                f.seek(offset - 1)
+                return f.read(1) == b'\n'
+        except FileNotFoundError:
+            return False
+    
+    def read_journal(self, dataset, offset=0):
+        """Yield journal events from a byte offset, skipping a torn line left by a crash mid-append"""
+        try:
+            with open(self.journal_path(dataset), 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        event = self.codec.loads(line)
+                    except ValueError:
+                        continue
+                    yield event
+        except FileNotFoundError:
+            return
+    
+    def append(self, dataset, op, record):
+        """Append one event to the journal and fsync it"""
+        line = self.codec.dumps_line({'op': op, 'record': record}) + b'\n'
+        with open(self.journal_path(dataset), 'ab+') as f:
+            # Writers on other stripes may append concurrently; the short
+            # dataset lock makes the signatures around this append exact
+            with self.lock, FileLock(self.lock_path(dataset)):
+                before = self.signature(dataset)
+                # Start on a fresh line if a previous append was torn
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+                f.flush()
+                size = f.tell()
+                after = self.signature(dataset)
+            # fsync outside the lock, so appends on other stripes are not held
+            # up behind it (the caller still holds its own stripes)
+            os.fsync(f.fileno())
+        
+        if size > self.compact_bytes:
+            self.compact_in_background(dataset)
+        return before, after
+    
+    def insert(self, dataset, record, all_records):
+        """Journal a create event"""
+        if dataset not in self.JOURNALED:
+            return super().insert(dataset, record, all_records)
+        return self.append(dataset, 'create', record)
+    
+    def update(self, dataset, record, all_records):
+        """Journal an update event (status change, payment, reschedule, ...)"""
+        if dataset not in self.JOURNALED:
+            return super().update(dataset, record, all_records)
+        return self.append(dataset, 'update', record)
+    
+    def replace_all(self, dataset, records):
+        """Write a new snapshot and clear the journal"""
+        if dataset not in self.JOURNALED:
+            return super().replace_all(dataset, records)
+        with self.lock:
+            before = self.signature(dataset)
+            self.write_snapshot(dataset, records)
+            return before, self.signature(dataset)
+    
+    def compact(self, dataset):
+        """Fold the journal into a new snapshot and clear the journal"""
+        # Wait out every writer, in this process or any other
+        with self.striped_lock(dataset, ()), self.lock:
+            self.write_snapshot(dataset, self.load(dataset))
+    
+    def write_snapshot(self, dataset, records):
+        """Swap in a new snapshot, then clear the journal (caller holds self.lock and every stripe)"""
+        write_json_file(self.path(dataset), records, self.codec)
+        # Safe to crash here: replaying already-compacted events is a no-op
+        with open(self.journal_path(dataset), 'w') as f:
+            os.fsync(f.fileno())
+    
+    def compact_in_background(self, dataset):
+        """Start compaction on a daemon thread unless one is already running"""
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        
+        def run():
+            try:
+                self.compact(dataset)
+            finally:
+                self.compacting = False
+        
+        threading.Thread(target=run, daemon=True).start()
+
+def create_backend(name, data_dir='data', codec=None):
+    """Build a storage backend from its configuration name ('json', 'sqlite' or 'journal')"""
+    if name == 'json':
+        return JSONBackend(data_dir, codec)
+    if name == 'sqlite':
+        return SQLiteBackend(data_dir, codec=codec)
+    if name == 'journal':
+        return JournalBackend(data_dir, codec=codec)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+def migrate_json_to_sqlite(data_dir='data', db_path=None):
+    """
+    One-shot copy of users.json and appointments.json into the SQLite database.
+    Refuses to run if the database already holds data, so it is safe to re-run.
+    Returns {table: rows copied}.
+    """
+    source = JSONBackend(data_dir)
+    target = SQLiteBackend(data_dir, db_path)
+    
+    copied = {}
+    for dataset in SQLiteBackend.TABLES:
+        if target.load(dataset):
+            raise RuntimeError(f"{target.db_path} already contains {dataset}; not migrating")
+        records = source.load(dataset)
+        target.insert_many(dataset, records)
+        copied[dataset] = len(records)
+    return copied
+
+def benchmark_codecs(data_dir='data', seconds=0.5):
+    """
+    Time parsing and encoding each dataset file with every available codec,
+    compact and pretty. Returns [(dataset, codec, mode, size, parse MB/s, dump MB/s)].
+    """
+    def throughput(func, size):
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                return runs * size / elapsed / 1e6
+    
+    results = []
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(data_dir, filename), 'rb') as f:
+            records = json.loads(f.read())
+        for name in CODECS:
+            if name == 'orjson' and orjson is None:
+                continue
+            for pretty in (False, True):
+                codec = get_codec(name, pretty)
+                data = codec.dumps(records)
+                parse = throughput(lambda: codec.loads(data), len(data))
+                dump = throughput(lambda: codec.dumps(records), len(data))
+                mode = 'pretty' if pretty else 'compact'
+                results.append((filename[:-5], name, mode, len(data), parse, dump))
+    return results
+
+if __name__ == '__main__':
+    # Usage: python storage.py migrate [data_dir]
+    #        python storage.py benchmark [data_dir]
+    if len(sys.argv) < 2 or sys.argv[1] not in ('migrate', 'benchmark'):
+        print('Usage: python storage.py migrate|benchmark [data_dir]')
+        sys.exit(1)
+    
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else 'data'
+    if sys.argv[1] == 'benchmark':
+        print(f"{'dataset':<14}{'codec':<8}{'mode':<9}{'bytes':>10}{'parse MB/s':>12}{'dump MB/s':>12}")
+        for dataset, name, mode, size, parse, dump in benchmark_codecs(data_dir):
+            print(f'{dataset:<14}{name:<8}{mode:<9}{size:>10}{parse:>12.1f}{dump:>12.1f}')
+        sys.exit(0)
+    
+    for table, count in migrate_json_to_sqlite(data_dir).items():
+        print(f'Migrated {count} {table}')
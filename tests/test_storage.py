@@ -0,0 +1,122 @@
+"""Regression tests for the storage backends and the DataHandler cache"""
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+
+from data_handler import DataHandler
+
+TIME_SLOTS = ['09:00 AM', '10:00 AM']
+
+def appointment(doctor_id, date, time):
+    """A pending appointment record as book_appointment creates it"""
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': 'user1',
+        'user_email': 'patient@example.com',
+        'doctor_id': doctor_id,
+        'date': date,
+        'time': time,
+        'status': 'pending_payment',
+        'payment_status': 'Pending',
+    }
+
+class SQLiteInterleavingTest(unittest.TestCase):
+    """Two workers sharing one appointments.db"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.worker = DataHandler(self.data_dir, backend='sqlite', time_slots=TIME_SLOTS)
+        self.other = DataHandler(self.data_dir, backend='sqlite', time_slots=TIME_SLOTS)
+        self.worker.get_appointments()
+
+    def test_reload_before_own_commit_keeps_booking(self):
+        # Another worker commits, then a reader thread in this worker reloads,
+        # and only then does this worker's INSERT commit
+        insert = self.worker.backend.insert
+
+        def interleaved(*args):
+            self.other.atomic_book_slot('doc2', '2031-01-01', '09:00 AM',
+                                        appointment('doc2', '2031-01-01', '09:00 AM'))
+            reader = threading.Thread(target=self.worker.get_appointments)
+            reader.start()
+            reader.join()
+            return insert(*args)
+
+        self.worker.backend.insert = interleaved
+        first = appointment('doc1', '2031-01-01', '10:00 AM')
+        booked, _, _ = self.worker.atomic_book_slot('doc1', '2031-01-01', '10:00 AM', first)
+        self.worker.backend.insert = insert
+
+        self.assertTrue(booked)
+        self.assertIsNotNone(self.worker.get_appointment_by_id(first['id']))
+        second = appointment('doc1', '2031-01-01', '10:00 AM')
+        booked, _, _ = self.worker.atomic_book_slot('doc1', '2031-01-01', '10:00 AM', second)
+        self.assertFalse(booked)
+        self.assertEqual(len(self.worker.get_appointments()), 2)
+
+class CatchUpTest(unittest.TestCase):
+    """A worker applying another worker's writes without a full reload"""
+
+    backend = 'sqlite'
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.worker = DataHandler(self.data_dir, backend=self.backend, time_slots=TIME_SLOTS)
+        self.other = DataHandler(self.data_dir, backend=self.backend, time_slots=TIME_SLOTS)
+
+    def book(self, handler, time):
+        record = appointment('doc1', '2031-01-01', time)
+        handler.atomic_book_slot('doc1', '2031-01-01', time, record)
+        return record
+
+    def test_other_workers_writes_are_applied_in_place(self):
+        first = self.book(self.worker, '09:00 AM')
+        cached = self.worker.load_cached('appointments')
+
+        second = self.book(self.other, '10:00 AM')
+        self.other.cancel_appointment(first['id'])
+
+        self.assertIs(self.worker.load_cached('appointments'), cached)
+        self.assertEqual(self.worker.get_appointment_by_id(first['id'])['status'], 'cancelled')
+        self.assertIsNotNone(self.worker.get_appointment_by_id(second['id']))
+        self.assertEqual(self.worker.get_admin_stats()['total_bookings'], 2)
+        booked, _, _ = self.worker.atomic_book_slot('doc1', '2031-01-01', '10:00 AM',
+                                                    appointment('doc1', '2031-01-01', '10:00 AM'))
+        self.assertFalse(booked)
+
+    def test_replace_all_reloads(self):
+        self.book(self.worker, '09:00 AM')
+        cached = self.worker.load_cached('appointments')
+
+        self.other.replace_records('appointments', [])
+
+        self.assertIsNot(self.worker.load_cached('appointments'), cached)
+        self.assertEqual(self.worker.get_appointments(), [])
+
+class JournalCatchUpTest(CatchUpTest):
+    backend = 'journal'
+
+class RebuildStatsTest(unittest.TestCase):
+    """rebuild_admin_stats reaching a worker in another process"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.worker = DataHandler(self.data_dir, time_slots=TIME_SLOTS)
+        self.worker.atomic_book_slot('doc1', '2031-01-01', '09:00 AM',
+                                     appointment('doc1', '2031-01-01', '09:00 AM'))
+
+    def test_rebuild_recounts_other_workers(self):
+        # Drift the worker's maintained counts without touching the stored data
+        self.worker.load_cached('appointments').aggregates['stats'].total += 5
+        self.assertEqual(self.worker.get_admin_stats()['total_bookings'], 6)
+
+        DataHandler(self.data_dir, time_slots=TIME_SLOTS).rebuild_admin_stats()
+        self.assertEqual(self.worker.get_admin_stats()['total_bookings'], 1)
+
+if __name__ == '__main__':
+    unittest.main()